@@ -0,0 +1,243 @@
+"""
+Classify transcript files outside Streamlit, e.g. as a nightly batch job.
+
+    python batch_classify.py transcripts/ "archive/2024-*.xlsx" -o classified/
+
+Every xlsx / csv / parquet input (first sheet for xlsx) needs Role and
+Utterance columns. Each one is written to the output directory with
+Predicted_Label, Confidence and Runner_Up_Label columns added, and
+consolidated_class_analysis.csv gets one LECT / INST / QUES / RESP row per
+file, as on the Consolidated page; class_metrics.csv adds PNR, IDIR, CBI
+and the quadrant of each class. Finished files are recorded in
+progress.json with the model version that classified them, so a rerun
+skips anything unchanged since it was done by the same backend, weights
+and length policy.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+import pandas as pd
+
+import inference
+from consolidation import LABEL_COLUMNS, class_row
+from interaction_metrics import add_metrics
+from streaming_io import DEFAULT_CHUNK_ROWS, FILE_TYPES, file_kind, iter_chunks, write_xlsx
+
+PROGRESS_FILE = "progress.json"
+SUMMARY_FILE = "consolidated_class_analysis.csv"
+METRICS_FILE = "class_metrics.csv"
+
+
+# ---------------- Inputs ----------------
+def find_inputs(patterns):
+    """Expand directories and globs into a sorted, de-duplicated list of files."""
+
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in FILE_TYPES:
+                found.extend(glob.glob(os.path.join(pattern, f"*.{extension}")))
+        else:
+            found.extend(glob.glob(pattern))
+
+    return sorted({
+        os.path.abspath(path) for path in found
+        if os.path.isfile(path) and not os.path.basename(path).startswith("~$")
+    })
+
+
+def output_names(inputs):
+    """
+    {input: name of its output file and summary row}: the file stem, with a
+    hash of the full path added where several inputs share a stem
+    (a/x.xlsx and b/x.xlsx, or x.xlsx and x.parquet).
+    """
+
+    stems = {path: os.path.splitext(os.path.basename(path))[0] for path in inputs}
+    taken = Counter(stems.values())
+    return {
+        path: stem if taken[stem] == 1 else f"{stem}_{hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]}"
+        for path, stem in stems.items()
+    }
+
+
+def output_path(path: str, output_dir: str, name: str) -> str:
+    return os.path.join(output_dir, f"{name}_classified.{'csv' if file_kind(path) == 'csv' else 'xlsx'}")
+
+
+def _fingerprint(path: str):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# ---------------- Progress Manifest ----------------
+def load_progress(output_dir: str):
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_progress(output_dir: str, progress):
+    """Write the manifest atomically, so a killed job never leaves it half-written."""
+
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(progress, fh, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def is_done(progress, path: str, output: str, version: str):
+    """
+    `path` is unchanged since model `version` (inference.model_version())
+    classified it into `output`, and that file is still there.
+    """
+
+    entry = progress.get(path)
+    return (
+        entry is not None
+        and entry["input"] == _fingerprint(path)
+        and entry["output"] == output
+        and entry.get("model") == version
+        and os.path.exists(output)
+    )
+
+
+# ---------------- Classification ----------------
+def classify_file(path: str, output_dir: str, batch_size: int, chunk_rows: int, name: str = None):
+    """
+    Classify one file chunk by chunk and write it to `output_dir` as
+    `name` (default: the file stem). Returns the manifest entry: output
+    path, row count, label counts, timing.
+    """
+
+    start = time.perf_counter()
+    kind = file_kind(path)
+    output = output_path(path, output_dir, name or os.path.splitext(os.path.basename(path))[0])
+
+    counts = dict.fromkeys(LABEL_COLUMNS, 0)
+    rows = 0
+
+    def classified_chunks():
+        nonlocal rows
+        for chunk in iter_chunks(path, chunk_rows=chunk_rows):
+            if "Role" not in chunk.columns or "Utterance" not in chunk.columns:
+                raise ValueError(f"{path} must contain Role and Utterance columns")
+
+            probabilities, id_to_label = inference.predict_proba(
+                chunk["Role"].astype(str).tolist(),
+                chunk["Utterance"].astype(str).tolist(),
+                batch_size,
+            )
+            ranked = inference.distribution_columns(probabilities, id_to_label, top_k=2)
+            for column in ("Predicted_Label", "Confidence", "Runner_Up_Label"):
+                chunk[column] = ranked[column].to_numpy()
+
+            rows += len(chunk)
+            for label, count in chunk["Predicted_Label"].value_counts().items():
+                if label in counts:
+                    counts[label] += int(count)
+            yield chunk
+
+    # Write to a temporary name first: a half-written output never counts as done
+    partial = output + ".partial"
+    if kind == "csv":
+        first = True
+        for chunk in classified_chunks():
+            chunk.to_csv(partial, mode="w" if first else "a", header=first, index=False)
+            first = False
+        if first:
+            open(partial, "w").close()
+    else:
+        with open(partial, "wb") as fh:
+            fh.write(write_xlsx(classified_chunks()).getvalue())
+    os.replace(partial, output)
+
+    return {
+        "output": output,
+        "rows": rows,
+        "counts": counts,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def run(inputs, output_dir: str, batch_size: int, chunk_rows: int, resume: bool = True):
+    """Classify every input, skipping finished ones, and write the summary sheet."""
+
+    os.makedirs(output_dir, exist_ok=True)
+    progress = load_progress(output_dir) if resume else {}
+
+    names = output_names(inputs)
+    # Backend + model checksum + length policy: anything else means redo the file
+    version = inference.model_version()
+
+    job_start = time.perf_counter()
+    for number, path in enumerate(inputs, start=1):
+        if is_done(progress, path, output_path(path, output_dir, names[path]), version):
+            print(f"[{number}/{len(inputs)}] {path}: already done, skipping")
+            continue
+
+        try:
+            entry = classify_file(path, output_dir, batch_size, chunk_rows, names[path])
+        except Exception as exc:  # keep going; the file is retried next run
+            print(f"[{number}/{len(inputs)}] {path}: FAILED ({exc})")
+            continue
+
+        entry["input"] = _fingerprint(path)
+        entry["model"] = version
+        progress[path] = entry
+        save_progress(output_dir, progress)
+
+        rate = entry["rows"] / entry["seconds"] if entry["seconds"] else 0.0
+        print(
+            f"[{number}/{len(inputs)}] {path}: {entry['rows']} rows in "
+            f"{entry['seconds']:.2f}s ({rate:.0f} rows/s)"
+        )
+
+    # Consolidated LECT / INST / QUES / RESP sheet, one row per finished input
+    summary = pd.DataFrame([
+        class_row(names[path], progress[path]["counts"])
+        for path in inputs if path in progress
+    ])
+    summary_path = os.path.join(output_dir, SUMMARY_FILE)
+    summary.to_csv(summary_path, index=False)
+
+    if not summary.empty:
+        add_metrics(summary).to_csv(os.path.join(output_dir, METRICS_FILE), index=False)
+
+    print(f"Done in {time.perf_counter() - job_start:.2f}s; summary written to {summary_path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="classified")
+    parser.add_argument("--batch-size", type=int, default=inference.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--backend", choices=inference.BACKENDS, default=inference.BACKEND)
+    parser.add_argument("--restart", action="store_true", help="ignore progress.json and redo every file")
+    args = parser.parse_args()
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        parser.error("no input files found")
+
+    inference.set_backend(args.backend)
+
+    # One shared model instance for the whole job
+    bundle = inference.load_model()
+    print(f"Model ({args.backend}) loaded in {bundle['load_seconds']:.2f}s; {len(inputs)} file(s) to process")
+
+    run(inputs, args.output_dir, args.batch_size, args.chunk_rows, resume=not args.restart)
+
+
+if __name__ == "__main__":
+    main()
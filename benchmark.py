@@ -0,0 +1,300 @@
+"""
+Throughput / latency benchmarks for the classifier, with regression checks
+against a saved baseline. Runs offline on CPU; every configuration runs in
+its own process so thread settings and peak RSS do not leak between them.
+
+    python benchmark.py run -o bench.json
+    python benchmark.py run --batch-sizes 1,32 --lengths natural,64 --threads 1,4 \\
+        --backends torch,onnx-int8 -o bench.json
+    python benchmark.py compare baseline.json bench.json --tolerance 0.10
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import inference
+
+DEFAULT_UTTERANCES = 512
+DEFAULT_REPEATS = 3
+DEFAULT_TOLERANCE = 0.10
+
+# Share of Teacher rows and word-count distributions (lognormal mu, sigma) of
+# each role, close to the classroom transcripts the app sees: teachers talk
+# in long turns, students answer in a few words
+TEACHER_SHARE = 0.6
+WORDS = {"Teacher": (2.8, 0.6), "Student": (1.6, 0.7)}
+
+VOCABULARY = {
+    "Teacher": (
+        "today we will look at how the water cycle works so open your books to page "
+        "forty and read the first paragraph then tell me what evaporation means who "
+        "can explain why the sun matters here remember that clouds form when vapour "
+        "cools please write down the three stages and underline the key words good "
+        "now think about what happens next in the experiment we did last week"
+    ).split(),
+    "Student": (
+        "yes no i think it is because the water gets hot and goes up into the sky "
+        "maybe clouds rain evaporation ma'am sir can i go i don't know the answer is "
+        "three stages okay sorry what page"
+    ).split(),
+}
+
+
+# ---------------- Synthetic Corpus ----------------
+def synthetic_corpus(n: int = DEFAULT_UTTERANCES, words: int = None, seed: int = 0):
+    """
+    (roles, utterances) for `n` synthetic classroom turns. With `words`
+    set, every utterance has exactly that many words (for sequence-length
+    sweeps); otherwise lengths follow the Teacher / Student distributions.
+    """
+
+    rng = np.random.default_rng(seed)
+    roles = np.where(rng.random(n) < TEACHER_SHARE, "Teacher", "Student")
+
+    utterances = []
+    for role in roles:
+        if words is None:
+            mu, sigma = WORDS[role]
+            count = max(1, int(rng.lognormal(mu, sigma)))
+        else:
+            count = words
+        utterances.append(" ".join(rng.choice(VOCABULARY[role], size=count)))
+
+    return roles.tolist(), utterances
+
+
+# ---------------- One Configuration ----------------
+def _percentiles(seconds):
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+    }
+
+
+def _peak_rss_mb() -> float:
+    import resource
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_config(config, utterances: int = DEFAULT_UTTERANCES, repeats: int = DEFAULT_REPEATS):
+    """
+    Benchmark one {backend, batch_size, length, threads} configuration in
+    this process, on inference.MODEL_DIR with the prediction cache off.
+    Meant to run in a fresh process (see run_sweep).
+    """
+
+    import torch
+
+    torch.set_num_threads(config["threads"])
+    inference.USE_CACHE = False
+    inference.set_backend(config["backend"])
+
+    bundle = inference.load_model()
+    roles, texts = synthetic_corpus(utterances, config["length"])
+    pairs = [f"{role}: {text}" for role, text in zip(roles, texts)]
+    batch_size = config["batch_size"]
+
+    # The remote backend has no local tokenizer
+    tokenizer = bundle["tokenizer"]
+    lengths = [len(ids) for ids in tokenizer(pairs, truncation=True)["input_ids"]] if tokenizer else [np.nan]
+
+    # Warm-up: first calls pay for allocator / kernel setup
+    inference.predict_labels(roles[:batch_size], texts[:batch_size], batch_size)
+
+    # One call per batch, as a client sending `batch_size` rows would
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for offset in range(0, len(texts), batch_size):
+            call_start = time.perf_counter()
+            inference.predict_labels(roles[offset:offset + batch_size], texts[offset:offset + batch_size], batch_size)
+            latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    return {
+        **config,
+        "utterances": utterances * repeats,
+        "mean_tokens": float(np.mean(lengths)),
+        "load_seconds": bundle["load_seconds"],
+        "utterances_per_sec": utterances * repeats / elapsed,
+        "latency_ms": _percentiles(latencies),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_isolated(config, utterances, repeats):
+    os.environ["CLASSROOM_NUM_THREADS"] = str(config["threads"])
+    return run_config(config, utterances, repeats)
+
+
+def run_sweep(batch_sizes, lengths, threads, backends, utterances: int = DEFAULT_UTTERANCES,
+              repeats: int = DEFAULT_REPEATS, model_dir: str = None, progress=print):
+    """Every combination, each in a fresh spawned process. Returns the report dict."""
+
+    model_dir = model_dir or inference.MODEL_DIR
+
+    # Read by the spawned processes when they import inference; never reach
+    # out for model files
+    os.environ["CLASSROOM_MODEL_DIR"] = model_dir
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+    results = []
+    for backend, length, thread_count, batch_size in itertools.product(backends, lengths, threads, batch_sizes):
+        config = {"backend": backend, "length": length, "threads": thread_count, "batch_size": batch_size}
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(_run_isolated, config, utterances, repeats).result()
+
+        results.append(result)
+        if progress is not None:
+            progress(
+                f"{_config_name(result):<40} {result['utterances_per_sec']:9.1f} utt/s  "
+                f"p50 {result['latency_ms']['p50']:8.1f} ms  p95 {result['latency_ms']['p95']:8.1f} ms  "
+                f"p99 {result['latency_ms']['p99']:8.1f} ms  rss {result['peak_rss_mb']:7.0f} MB"
+            )
+
+    return {"environment": environment(model_dir), "results": results}
+
+
+def environment(model_dir: str = None):
+    """Library versions and machine details stored with a report."""
+
+    model_dir = model_dir or inference.MODEL_DIR
+
+    versions = {}
+    for module in ("torch", "transformers", "onnxruntime", "numpy"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+
+    from prediction_cache import model_checksum
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model_checksum": model_checksum(model_dir),
+        "versions": versions,
+    }
+
+
+# ---------------- Comparison ----------------
+def _config_name(result) -> str:
+    length = "natural" if result["length"] is None else f"{result['length']}w"
+    return f"{result['backend']}/len={length}/threads={result['threads']}/batch={result['batch_size']}"
+
+
+def compare(baseline, current, tolerance: float = DEFAULT_TOLERANCE):
+    """
+    Per-configuration changes between two reports. A configuration regresses
+    when throughput drops, or p95 latency or peak RSS grows, by more than
+    `tolerance` (a fraction). Returns a list of rows with a "regressions" list.
+    """
+
+    baseline_by_name = {_config_name(result): result for result in baseline["results"]}
+    rows = []
+
+    for result in current["results"]:
+        name = _config_name(result)
+        before = baseline_by_name.get(name)
+        if before is None:
+            continue
+
+        changes = {
+            "utterances_per_sec": result["utterances_per_sec"] / before["utterances_per_sec"] - 1,
+            "p95_ms": result["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1,
+            "peak_rss_mb": result["peak_rss_mb"] / before["peak_rss_mb"] - 1,
+        }
+        regressions = [
+            metric for metric, change in changes.items()
+            if (change < -tolerance if metric == "utterances_per_sec" else change > tolerance)
+        ]
+        rows.append({"config": name, "changes": changes, "regressions": regressions})
+
+    return rows
+
+
+# ---------------- CLI ----------------
+def _int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+def _length_list(value):
+    return [None if item == "natural" else int(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run a sweep and write a JSON report")
+    run.add_argument("--model-dir", default=inference.MODEL_DIR)
+    run.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    run.add_argument("--lengths", type=_length_list, default=[None],
+                     help="words per utterance, or 'natural' for the Teacher/Student mix")
+    run.add_argument("--threads", type=_int_list, default=[min(4, os.cpu_count() or 1)])
+    run.add_argument("--backends", type=lambda value: value.split(","), default=["torch"])
+    run.add_argument("--utterances", type=int, default=DEFAULT_UTTERANCES)
+    run.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    run.add_argument("-o", "--output", default="benchmark.json")
+    run.add_argument("--baseline", help="compare against this report when done")
+    run.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+
+    check = commands.add_parser("compare", help="flag regressions of a report against a baseline")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        unknown = set(args.backends) - set(inference.BACKENDS)
+        if unknown:
+            parser.error(f"unknown backend(s): {', '.join(sorted(unknown))}")
+
+        report = run_sweep(args.batch_sizes, args.lengths, args.threads, args.backends,
+                           args.utterances, args.repeats, args.model_dir)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Wrote {args.output}")
+
+        if not args.baseline:
+            return
+        current, baseline_path = report, args.baseline
+    else:
+        with open(args.current, encoding="utf-8") as fh:
+            current = json.load(fh)
+        baseline_path = args.baseline
+
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+
+    rows = compare(baseline, current, args.tolerance)
+    for row in rows:
+        changes = "  ".join(f"{metric} {change:+.1%}" for metric, change in row["changes"].items())
+        flag = "REGRESSION " + ",".join(row["regressions"]) if row["regressions"] else "ok"
+        print(f"{row['config']:<40} {changes}  {flag}")
+
+    if not rows:
+        print("No configurations in common with the baseline")
+    sys.exit(1 if any(row["regressions"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
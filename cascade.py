@@ -0,0 +1,197 @@
+"""
+Confidence-gated cascade: hand-written rules and the distilled linear model
+answer the rows they are sure of, and only the rest reach the transformer.
+Check thresholds against running every row through the transformer before
+switching it on:
+
+    python cascade.py check transcripts.xlsx
+    python cascade.py check transcripts.xlsx --thresholds 0.8,0.9,0.95 --stages rules,linear
+
+Use it with CLASSROOM_BACKEND=cascade (CLASSROOM_CASCADE_STAGES,
+CLASSROOM_CASCADE_RULES_THRESHOLD, CLASSROOM_CASCADE_LINEAR_THRESHOLD,
+CLASSROOM_CASCADE_FINAL) or inference.set_backend("cascade") and
+inference.set_cascade(). The linear stage needs `python distill.py linear`.
+"""
+
+import argparse
+import re
+import time
+
+import numpy as np
+
+import inference
+
+# Part of the cascade's prediction-cache namespace; bump it whenever RULES change
+RULES_VERSION = 1
+
+# Most words in a student turn the short-reply rule accepts
+SHORT_REPLY_WORDS = 4
+
+IMPERATIVES = (
+    "open close write read look listen turn take sit stand put copy underline "
+    "repeat say come show tell answer raise stop draw complete finish discuss "
+    "check find circle match fill count"
+).split()
+
+# (label, confidence, role, pattern), tried in order; the first rule whose
+# role matches and whose pattern matches the utterance answers the row
+RULES = (
+    ("QUES", 0.95, "teacher", re.compile(r"\?\s*$")),
+    ("INST", 0.92, "teacher", re.compile(r"^(?:now\s+|please\s+|ok(?:ay)?\s+|everyone\s+)*(?:%s)\b" % "|".join(IMPERATIVES), re.I)),
+    ("RESP", 0.90, "student", re.compile(r"^[^\s?]+(?:\s+[^\s?]+){0,%d}$" % (SHORT_REPLY_WORDS - 1))),
+)
+
+
+# ---------------- Rules ----------------
+def _split_role(text: str):
+    """("teacher" / "student" / ..., utterance) from a "Role: utterance" model input."""
+
+    role, sep, utterance = text.partition(":")
+    if not sep:
+        return "", text.strip()
+    return role.strip().lower(), utterance.strip()
+
+
+def rule_label(text: str):
+    """(label, confidence) of the first rule that fires on `text`, or None."""
+
+    role, utterance = _split_role(text)
+    for label, confidence, rule_role, pattern in RULES:
+        if role == rule_role and pattern.search(utterance):
+            return label, confidence
+    return None
+
+
+def rule_probabilities(texts, classes):
+    """
+    (n texts, n classes) distributions from RULES: a fired rule puts its
+    confidence on its label and spreads the rest over the other classes;
+    rows no rule fires on are all zeros, so every threshold escalates them.
+    """
+
+    index = {label: i for i, label in enumerate(classes)}
+    probabilities = np.zeros((len(texts), len(classes)), dtype=np.float32)
+    rest = max(len(classes) - 1, 1)
+
+    for row, text in enumerate(texts):
+        fired = rule_label(text)
+        if fired is None or fired[0] not in index:
+            continue
+        label, confidence = fired
+        probabilities[row] = (1.0 - confidence) / rest
+        probabilities[row, index[label]] = confidence
+
+    return probabilities
+
+
+# ---------------- Threshold Check ----------------
+def route(stage_probabilities, thresholds):
+    """
+    Index of the stage that answers each row (len(stage_probabilities) for
+    rows that are escalated), given every stage's probabilities on every row.
+    """
+
+    n = len(stage_probabilities[0]) if stage_probabilities else 0
+    answered_by = np.full(n, len(stage_probabilities), dtype=np.int64)
+    for position, (probabilities, threshold) in reversed(list(enumerate(zip(stage_probabilities, thresholds)))):
+        answered_by[probabilities.max(axis=1) >= threshold] = position
+    return answered_by
+
+
+def check_cascade(texts, thresholds, stages=None, final: str = None,
+                  batch_size: int = inference.DEFAULT_BATCH_SIZE, gold=None):
+    """
+    Escalation rate and agreement with `final` on every row, per threshold
+    (applied to every stage), plus the time of the real cascade run and of
+    the final backend alone. Each stage's share and agreement is included
+    so the per-stage thresholds can be set separately.
+    """
+
+    stages = tuple(stages or inference.CASCADE_STAGES)
+    final = final or inference.CASCADE_FINAL
+    classes = list(inference.load_model(backend=final)["label_encoder"].classes_)
+
+    start = time.perf_counter()
+    reference = inference._probabilities(texts, batch_size, backend=final)
+    final_seconds = time.perf_counter() - start
+    reference_labels = reference.argmax(axis=1)
+
+    stage_probabilities = [
+        rule_probabilities(texts, classes) if stage == "rules"
+        else inference._probabilities(texts, batch_size, backend=stage)
+        for stage in stages
+    ]
+
+    saved = inference.CASCADE_STAGES, inference.CASCADE_THRESHOLDS, inference.CASCADE_FINAL
+    rows = []
+    try:
+        for threshold in thresholds:
+            inference.set_cascade(stages, {stage: threshold for stage in stages}, final)
+
+            start = time.perf_counter()
+            labels = inference._probabilities(texts, batch_size, backend="cascade").argmax(axis=1)
+            cascade_seconds = time.perf_counter() - start
+
+            answered_by = route(stage_probabilities, [threshold] * len(stages))
+            per_stage = {}
+            for position, stage in enumerate(stages):
+                kept = answered_by == position
+                per_stage[stage] = {
+                    "rows": int(kept.sum()),
+                    "agreement": float((labels[kept] == reference_labels[kept]).mean()) if kept.any() else float("nan"),
+                }
+
+            row = {
+                "threshold": threshold,
+                "escalation_rate": float((answered_by == len(stages)).mean()) if len(texts) else float("nan"),
+                "agreement": float((labels == reference_labels).mean()) if len(texts) else float("nan"),
+                "stages": per_stage,
+                "cascade_seconds": cascade_seconds,
+            }
+            if gold is not None:
+                encoded_gold = np.array([classes.index(g) if g in classes else -1 for g in gold])
+                row["accuracy"] = float((labels == encoded_gold).mean())
+                row["final_accuracy"] = float((reference_labels == encoded_gold).mean())
+            rows.append(row)
+    finally:
+        inference.set_cascade(*saved)
+
+    return {"final": final, "stages": stages, "rows": len(texts), "final_seconds": final_seconds, "thresholds": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check = commands.add_parser("check", help="escalation rate and agreement with the final backend per threshold")
+    check.add_argument("tables", nargs="+", help="xlsx / csv / parquet transcripts (Role, Utterance)")
+    check.add_argument("--thresholds", type=lambda value: [float(item) for item in value.split(",")],
+                       default=[0.8, 0.9, 0.95, 0.99])
+    check.add_argument("--stages", type=lambda value: value.split(","), default=list(inference.CASCADE_STAGES))
+    check.add_argument("--final", choices=inference.CASCADE_FINALS, default=inference.CASCADE_FINAL)
+    check.add_argument("--batch-size", type=int, default=inference.DEFAULT_BATCH_SIZE)
+
+    args = parser.parse_args()
+
+    unknown = set(args.stages) - set(inference.CASCADE_STAGE_NAMES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    from distill import load_corpus
+
+    texts, gold = load_corpus(args.tables)
+    report = check_cascade(texts, args.thresholds, args.stages, args.final, args.batch_size, gold)
+
+    print(f"{' -> '.join(report['stages'] + (report['final'],))} on {report['rows']} rows "
+          f"({report['final']} alone: {report['final_seconds']:.2f}s)")
+    for row in report["thresholds"]:
+        stages = "  ".join(
+            f"{stage} {entry['rows']} rows @ {entry['agreement']:.1%}" for stage, entry in row["stages"].items()
+        )
+        accuracy = f"  accuracy {row['accuracy']:.2%} (final {row['final_accuracy']:.2%})" if "accuracy" in row else ""
+        print(f"threshold {row['threshold']:.2f}: escalated {row['escalation_rate']:.1%}  "
+              f"agreement {row['agreement']:.2%}  {stages}  {row['cascade_seconds']:.2f}s{accuracy}")
+
+
+if __name__ == "__main__":
+    main()
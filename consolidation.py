@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+# Per-class label counts for the consolidated sheet, shared by the
+# Consolidated page and batch jobs.
+
+# Predicted label -> column in the consolidated sheet
+LABEL_COLUMNS = {
+    "LECT": "Lecture",
+    "INST": "Instruction",
+    "QUES": "Question",
+    "RESP": "Response",
+}
+
+# Columns a classified sheet must have to be counted
+REQUIRED_COLUMNS = {"Role", "Utterances", "Predicted_Label"}
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+def count_labels(chunks):
+    """Sum LECT / INST / QUES / RESP over an iterable of DataFrame chunks."""
+
+    counts = dict.fromkeys(LABEL_COLUMNS, 0)
+
+    for chunk in chunks:
+        # One categorical pass gives all four counts at once
+        chunk_counts = pd.Categorical(
+            chunk["Predicted_Label"], categories=list(LABEL_COLUMNS)
+        ).value_counts()
+        for label in LABEL_COLUMNS:
+            counts[label] += int(chunk_counts[label])
+
+    return counts
+
+
+def class_row(speaker: str, counts):
+    """One row of the consolidated sheet from label counts."""
+
+    row = {"Speakers": speaker}
+    for label, column in LABEL_COLUMNS.items():
+        row[column] = counts[label]
+    row["Total"] = sum(counts[label] for label in LABEL_COLUMNS)
+    return row
+
+
+# ---------------- Parallel Consolidation ----------------
+def _named_buffer(data: bytes, name: str):
+    buffer = BytesIO(data)
+    buffer.name = name
+    return buffer
+
+
+def _count_sheet(data: bytes, name: str, sheet_name):
+    """Worker task: (counts or None if columns are missing, seconds) for one sheet."""
+
+    from streaming_io import iter_chunks, read_header
+
+    start = time.perf_counter()
+    source = _named_buffer(data, name)
+
+    if not REQUIRED_COLUMNS.issubset(read_header(source, sheet_name)):
+        return None, time.perf_counter() - start
+
+    # Only the label column is read
+    counts = count_labels(iter_chunks(source, ["Predicted_Label"], sheet_name=sheet_name))
+    return counts, time.perf_counter() - start
+
+
+def consolidate(files, max_workers: int = DEFAULT_WORKERS):
+    """
+    Count labels for every sheet of every file, parsing sheets in parallel.
+
+    `files` is a list of (name, bytes). Returns (consolidated DataFrame,
+    per-file reports). Classes are numbered in file order, then sheet order,
+    whatever order the workers finish in. Each report holds the file name,
+    its (sheet, counts or None, seconds) entries and those seconds summed
+    (worker time across sheets, not wall time).
+    """
+
+    from streaming_io import sheet_names
+
+    tasks = [
+        (file_index, sheet_name, data, name)
+        for file_index, (name, data) in enumerate(files)
+        for sheet_name in sheet_names(_named_buffer(data, name))
+    ]
+
+    workers = max(1, min(max_workers, len(tasks)))
+
+    if workers == 1:
+        results = [_count_sheet(data, name, sheet_name) for _, sheet_name, data, name in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # map() hands results back in task order
+            results = list(pool.map(
+                _count_sheet,
+                [task[2] for task in tasks],
+                [task[3] for task in tasks],
+                [task[1] for task in tasks],
+            ))
+
+    reports = [{"name": name, "sheets": [], "seconds": 0.0} for name, _ in files]
+    rows = []
+
+    for (file_index, sheet_name, _, _), (counts, seconds) in zip(tasks, results):
+        reports[file_index]["sheets"].append((sheet_name, counts, seconds))
+        reports[file_index]["seconds"] += seconds
+        if counts is not None:
+            rows.append(class_row(f"Class {len(rows) + 1}", counts))
+
+    return pd.DataFrame(rows), reports
+
+
+# ---------------- Columnar Store ----------------
+def consolidate_stored(datasets, store_dir=None):
+    """
+    Consolidated sheet for classified datasets in the columnar store. Each
+    class partition is one class (a dataset without classes is one class),
+    numbered in dataset order, then class order.
+    """
+
+    from storage import PARTITION_COLUMN, STORE_DIR, load_classified
+
+    rows = []
+    for dataset in datasets:
+        # Only the label column (and the partition key) is read
+        frame = load_classified(dataset, columns=[PARTITION_COLUMN, "Predicted_Label"], store_dir=store_dir or STORE_DIR)
+
+        if PARTITION_COLUMN in frame.columns:
+            groups = [group for _, group in frame.groupby(PARTITION_COLUMN, observed=True, sort=True)]
+        else:
+            groups = [frame]
+
+        for group in groups:
+            rows.append(class_row(f"Class {len(rows) + 1}", count_labels([group])))
+
+    return pd.DataFrame(rows)
@@ -0,0 +1,300 @@
+"""
+Distil the classifier in model/ into a compact student trained on the
+teacher's soft labels, and report how well and how fast it agrees with the
+teacher on held-out rows.
+
+    python distill.py linear transcripts.xlsx [more.xlsx ...]
+    python distill.py student transcripts.xlsx --layers 2 --epochs 3
+    python distill.py compare held_out.xlsx --backend linear
+
+"linear" is TF-IDF + logistic regression (CPU-only, no torch at inference),
+written to model/linear/. "student" is the teacher's architecture with fewer
+transformer layers, initialised from evenly spaced teacher layers, written to
+model/student/ in the usual Hugging Face layout. Both hold their own
+label_encoder.joblib and a student.json with the agreement report; select
+one with CLASSROOM_BACKEND=linear / student.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+import inference
+
+DEFAULT_HOLDOUT = 0.2
+DEFAULT_LAYERS = 2
+DEFAULT_EPOCHS = 3
+DEFAULT_TEMPERATURE = 2.0
+DEFAULT_LEARNING_RATE = 1e-4
+
+# Soft-label weights below this are dropped from the linear student's training rows
+MIN_SOFT_WEIGHT = 1e-3
+
+REPORT_FILE = "student.json"
+
+
+# ---------------- Corpus ----------------
+def load_corpus(paths):
+    """(texts, gold labels or None) from tables with Role and Utterance columns."""
+
+    from onnx_export import GOLD_COLUMNS
+    from length_policy import corpus_texts
+    from streaming_io import read_header, read_table, sheet_names
+
+    texts, gold = [], []
+    for path in paths:
+        for sheet in sheet_names(path):
+            header = read_header(path, sheet)
+            if not {"Role", "Utterance"}.issubset(header):
+                continue
+            gold_column = next((column for column in GOLD_COLUMNS if column in header), None)
+            df = read_table(path, columns=["Role", "Utterance"] + ([gold_column] if gold_column else []), sheet_name=sheet)
+            texts += corpus_texts(df["Role"].astype(str), df["Utterance"].astype(str))
+            gold += df[gold_column].astype(str).tolist() if gold_column else [None] * len(df)
+
+    if not texts:
+        raise ValueError("No sheet with Role and Utterance columns in the given files")
+    return texts, (np.array(gold, dtype=object) if any(g is not None for g in gold) else None)
+
+
+def _split(n: int, holdout: float, seed: int = 0):
+    order = np.random.default_rng(seed).permutation(n)
+    cut = int(round(n * (1 - holdout)))
+    return order[:cut], order[cut:]
+
+
+def teacher_probabilities(texts, backend: str = "torch", batch_size: int = inference.DEFAULT_BATCH_SIZE):
+    """The teacher's full class distributions (label-encoder column order)."""
+    return inference._probabilities(texts, batch_size, backend=backend)
+
+
+# ---------------- Linear Student ----------------
+def train_linear(texts, soft_labels):
+    """
+    TF-IDF (word 1-2 grams) + multinomial logistic regression fitted to the
+    teacher's distributions: every text appears once per class, weighted
+    by the teacher's probability for that class.
+    """
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1)
+    features = vectorizer.fit_transform(texts)
+
+    rows, classes = np.nonzero(soft_labels >= MIN_SOFT_WEIGHT)
+    classifier = LogisticRegression(max_iter=2000, C=10.0)
+    classifier.fit(features[rows], classes, sample_weight=soft_labels[rows, classes])
+
+    # Columns of predict_proba must line up with the label encoder
+    if not np.array_equal(classifier.classes_, np.arange(soft_labels.shape[1])):
+        raise ValueError("The teacher never predicted some classes; add more transcripts")
+
+    return make_pipeline(vectorizer, classifier)
+
+
+def save_linear(pipeline, label_encoder, out_dir: str):
+    import joblib
+
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(pipeline, os.path.join(out_dir, inference.LINEAR_FILE))
+    joblib.dump(label_encoder, os.path.join(out_dir, "label_encoder.joblib"))
+
+
+# ---------------- Transformer Student ----------------
+def train_student(texts, soft_labels, layers: int = DEFAULT_LAYERS, epochs: int = DEFAULT_EPOCHS,
+                  temperature: float = DEFAULT_TEMPERATURE, learning_rate: float = DEFAULT_LEARNING_RATE,
+                  batch_size: int = inference.DEFAULT_BATCH_SIZE, progress=print):
+    """
+    A copy of the teacher with `layers` encoder layers, trained on the KL
+    divergence to the teacher's temperature-softened distributions.
+    """
+
+    import copy
+
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    bundle = inference.load_model(backend="torch")
+    teacher = bundle["model"]
+
+    config = copy.deepcopy(teacher.config)
+    teacher_layers = config.num_hidden_layers
+    layers = min(layers, teacher_layers)
+    config.num_hidden_layers = layers
+    student = AutoModelForSequenceClassification.from_config(config)
+
+    # Embeddings, head and evenly spaced encoder layers come from the teacher
+    picked = np.linspace(0, teacher_layers - 1, layers).round().astype(int)
+    renamed = {}
+    for name, tensor in teacher.state_dict().items():
+        if ".layer." in name:
+            prefix, rest = name.split(".layer.", 1)
+            index, rest = rest.split(".", 1)
+            if int(index) not in picked:
+                continue
+            name = f"{prefix}.layer.{int(np.flatnonzero(picked == int(index))[0])}.{rest}"
+        renamed[name] = tensor
+    student.load_state_dict(renamed, strict=False)
+
+    encodings = bundle["encodings"]
+    encoded, _ = encodings.encode(texts).truncated(bundle["max_tokens"], encodings.head, encodings.tail)
+    pad_id = bundle["tokenizer"].pad_token_id or 0
+    targets = torch.tensor(soft_labels, dtype=torch.float32)
+
+    # Soften the teacher the same way as the student
+    teacher_logits = torch.log(targets.clamp_min(1e-8)) / temperature
+    soft_targets = torch.softmax(teacher_logits, dim=-1)
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=learning_rate)
+    rng = np.random.default_rng(0)
+    student.train()
+
+    for epoch in range(epochs):
+        order = rng.permutation(len(texts))
+        total = 0.0
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            inputs = encoded.padded(rows, pad_id)
+            logits = student(**{name: torch.from_numpy(array) for name, array in inputs.items()}).logits
+
+            loss = torch.nn.functional.kl_div(
+                torch.log_softmax(logits / temperature, dim=-1), soft_targets[rows], reduction="batchmean"
+            ) * temperature ** 2
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            total += loss.item() * len(rows)
+
+        if progress is not None:
+            progress(f"epoch {epoch + 1}/{epochs}: distillation loss {total / len(texts):.4f}")
+
+    student.eval()
+    return student
+
+
+def save_student(student, out_dir: str, model_dir: str = None):
+    model_dir = model_dir or inference.MODEL_DIR
+    bundle = inference.load_model(model_dir, backend="torch")
+    os.makedirs(out_dir, exist_ok=True)
+    student.save_pretrained(out_dir)
+    bundle["tokenizer"].save_pretrained(out_dir)
+    shutil.copy(os.path.join(model_dir, "label_encoder.joblib"), out_dir)
+
+
+# ---------------- Agreement / Speed ----------------
+def _files_mb(path: str) -> float:
+    """Size of the files directly in `path` (a model dir's own files, not its subdirs)."""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file()) / 2 ** 20
+
+
+def compare(texts, backend: str, teacher_backend: str = "torch", gold=None,
+            batch_size: int = inference.DEFAULT_BATCH_SIZE):
+    """Agreement with the teacher, both timings and sizes (and accuracy if gold labels exist)."""
+
+    # Load both first, so timings are inference only
+    inference.load_model(backend=teacher_backend)
+    inference.load_model(backend=backend)
+
+    start = time.perf_counter()
+    teacher = inference._run_model(texts, batch_size, backend=teacher_backend)
+    teacher_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    student = inference._run_model(texts, batch_size, backend=backend)
+    student_seconds = time.perf_counter() - start
+
+    teacher_labels = np.array([label for label, _ in teacher], dtype=object)
+    student_labels = np.array([label for label, _ in student], dtype=object)
+
+    report = {
+        "backend": backend,
+        "teacher_backend": teacher_backend,
+        "rows": len(texts),
+        "agreement": float((teacher_labels == student_labels).mean()),
+        "teacher_utterances_per_sec": len(texts) / teacher_seconds,
+        "student_utterances_per_sec": len(texts) / student_seconds,
+        "speedup": teacher_seconds / student_seconds,
+        "teacher_mb": _files_mb(inference.MODEL_DIR),
+        "student_mb": _files_mb(inference.student_dir(backend)),
+    }
+    if gold is not None:
+        report["teacher_accuracy"] = float((teacher_labels == gold).mean())
+        report["student_accuracy"] = float((student_labels == gold).mean())
+    return report
+
+
+def print_report(report):
+    print(f"{report['backend']} vs {report['teacher_backend']} on {report['rows']} rows")
+    print(f"Agreement: {report['agreement']:.2%}")
+    if "student_accuracy" in report:
+        print(f"Accuracy: teacher {report['teacher_accuracy']:.2%}, student {report['student_accuracy']:.2%}")
+    print(f"Throughput: teacher {report['teacher_utterances_per_sec']:.0f} utt/s, "
+          f"student {report['student_utterances_per_sec']:.0f} utt/s ({report['speedup']:.1f}x)")
+    print(f"Size: teacher {report['teacher_mb']:.1f} MB, student {report['student_mb']:.1f} MB")
+
+
+# ---------------- CLI ----------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teacher-backend", default="torch", choices=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--batch-size", type=int, default=inference.DEFAULT_BATCH_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for kind, help_text in (("linear", "train the TF-IDF + logistic regression student"),
+                            ("student", "train a smaller transformer student")):
+        command = commands.add_parser(kind, help=help_text)
+        command.add_argument("tables", nargs="+", help="xlsx / csv / parquet transcripts (Role, Utterance)")
+        command.add_argument("--holdout", type=float, default=DEFAULT_HOLDOUT,
+                             help="share of rows kept out of training for the report")
+        if kind == "student":
+            command.add_argument("--layers", type=int, default=DEFAULT_LAYERS)
+            command.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS)
+            command.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE)
+            command.add_argument("--learning-rate", type=float, default=DEFAULT_LEARNING_RATE)
+
+    check = commands.add_parser("compare", help="agreement and speed of a trained student")
+    check.add_argument("tables", nargs="+")
+    check.add_argument("--backend", default="linear", choices=list(inference.STUDENT_DIRS))
+
+    args = parser.parse_args()
+    texts, gold = load_corpus(args.tables)
+
+    if args.command == "compare":
+        print_report(compare(texts, args.backend, args.teacher_backend, gold, args.batch_size))
+        return
+
+    train_rows, held_rows = _split(len(texts), args.holdout)
+    train_texts = [texts[i] for i in train_rows]
+    held_texts = [texts[i] for i in held_rows]
+
+    print(f"Teacher soft labels for {len(train_texts)} rows...")
+    soft_labels = teacher_probabilities(train_texts, args.teacher_backend, args.batch_size)
+    label_encoder = inference.load_model(backend=args.teacher_backend)["label_encoder"]
+    out_dir = inference.student_dir(args.command)
+
+    if args.command == "linear":
+        save_linear(train_linear(train_texts, soft_labels), label_encoder, out_dir)
+    else:
+        student = train_student(
+            train_texts, soft_labels, args.layers, args.epochs,
+            args.temperature, args.learning_rate, args.batch_size
+        )
+        save_student(student, out_dir)
+    print(f"Wrote {out_dir}")
+
+    if held_texts:
+        report = compare(held_texts, args.command, args.teacher_backend,
+                         gold[held_rows] if gold is not None else None, args.batch_size)
+        print_report(report)
+        with open(os.path.join(out_dir, REPORT_FILE), "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
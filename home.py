@@ -1,5 +1,9 @@
+import os
+
 import streamlit as st
 
+from inference import warm_up
+
 
 # ------------------------------------------------
 # PAGE CONFIG
@@ -11,6 +15,20 @@ st.set_page_config(
 )
 # st.sidebar.markdown("<div class='sidebar-title'>📚 Navigation</div>", unsafe_allow_html=True)
 
+# ------------------------------------------------
+# OPTIONAL MODEL WARM-UP
+# ------------------------------------------------
+# Set CLASSROOM_WARMUP=1 to start loading the classifier in a background
+# thread as soon as the server serves its first page.
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    # Once per server process, not once per rerun of this page
+    return warm_up()
+
+
+if os.environ.get("CLASSROOM_WARMUP") == "1":
+    start_warm_up()
+
 # ------------------------------------------------
 # CUSTOM CSS FOR BETTER UI
 # ------------------------------------------------
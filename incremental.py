@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Incremental re-classification: a re-uploaded transcript is diffed against
+# the last classified version by a content hash of each (Role, Utterance) row,
+# and only rows whose hash is new go to the model. Unchanged rows keep their
+# stored predictions, wherever they moved to in the file.
+
+# Columns carried over from the previous version for unchanged rows
+CARRIED_COLUMNS = ("Predicted_Label", "Confidence", "Runner_Up_Label")
+
+
+def row_keys(roles, utterances) -> np.ndarray:
+    """
+    uint64 content hash per row. Whitespace is normalized the way the
+    prediction cache keys it, so re-indented text still matches.
+    """
+
+    frame = pd.DataFrame({
+        "Role": pd.Series(roles, dtype="string").fillna(""),
+        "Utterance": pd.Series(utterances, dtype="string").fillna("").str.split().str.join(" "),
+    })
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+class PreviousVersion:
+    """Predictions of the last classified version, looked up by row key."""
+
+    def __init__(self, frame):
+        keys = row_keys(frame["Role"].astype(str), frame["Utterance"].astype(str))
+        columns = [column for column in CARRIED_COLUMNS if column in frame.columns]
+
+        # Duplicate rows share one prediction
+        carried = frame[columns].set_axis(keys)
+        self.table = carried[~carried.index.duplicated(keep="last")]
+        self.columns = columns
+        self._seen = np.zeros(len(self.table), dtype=bool)
+
+    def __len__(self):
+        return len(self.table)
+
+    @classmethod
+    def from_store(cls, dataset: str, version: str = None):
+        """
+        The stored dataset, or None if it does not exist or was classified by
+        a different model version (see inference.model_version).
+        """
+
+        from storage import load_classified, read_metadata
+
+        metadata = read_metadata(dataset)
+        if metadata is None:
+            return None
+        if version is not None and metadata.get("model_version") != version:
+            return None
+
+        frame = load_classified(dataset, columns=["Role", "Utterance", *CARRIED_COLUMNS])
+        if "Predicted_Label" not in frame.columns:
+            return None
+        return cls(frame)
+
+    def patch(self, chunk, classify):
+        """
+        Fill chunk's carried columns: stored values for unchanged rows,
+        `classify(changed_chunk)` for the rest. `classify` returns a
+        DataFrame with (at least) Predicted_Label, aligned with its input.
+        Returns the number of rows sent to `classify`.
+        """
+
+        keys = row_keys(chunk["Role"].astype(str), chunk["Utterance"].astype(str))
+        positions = self.table.index.get_indexer(keys)
+        found = positions >= 0
+        self._seen[positions[found]] = True
+
+        for column in self.columns:
+            values = pd.Series(pd.NA, index=chunk.index, dtype="object")
+            values[found] = self.table[column].to_numpy()[positions[found]]
+            chunk[column] = values
+
+        changed = ~found
+        if changed.any():
+            fresh = classify(chunk.loc[changed])
+            for column in fresh.columns:
+                if column not in chunk.columns:
+                    chunk[column] = pd.Series(pd.NA, index=chunk.index, dtype="object")
+                chunk.loc[changed, column] = fresh[column].to_numpy()
+
+        if "Confidence" in chunk.columns:
+            chunk["Confidence"] = pd.to_numeric(chunk["Confidence"])
+        return int(changed.sum())
+
+    def removed(self) -> int:
+        """Previous rows not matched by any patched chunk so far."""
+        return int((~self._seen).sum())
@@ -1,35 +1,736 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import joblib
+import os
+import threading
+import time
 
-MODEL_DIR = "model"
+import perf
 
-# ---------------- Load Tokenizer ----------------
-tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR)
+# torch / transformers are imported lazily inside load_model(), so importing
+# this module is cheap and pages that never classify don't pay for them.
 
-# ---------------- Load Label Encoder ----------------
-label_encoder = joblib.load(f"{MODEL_DIR}/label_encoder.joblib")
+# Default model directory. Functions taking `model_dir` read it when called
+# (not when defined), so assigning inference.MODEL_DIR takes effect.
+MODEL_DIR = os.environ.get("CLASSROOM_MODEL_DIR", "model")
+DEFAULT_BATCH_SIZE = 32
+
+# Set CLASSROOM_CACHE=0 to always run the model
+USE_CACHE = os.environ.get("CLASSROOM_CACHE", "1") != "0"
+
+# Most encodings kept per model in the in-memory tokenization LRU
+TOKEN_CACHE_ENTRIES = int(os.environ.get("CLASSROOM_TOKEN_CACHE", "100000"))
+
+# How torch checkpoints are loaded: "copy" reads the weights into this
+# process's memory; "mmap" builds the model over a memory map of
+# model.safetensors, so every process on the host shares one copy of the
+# weights (see shared_weights.py)
+WEIGHT_LOADING_MODES = ("copy", "mmap")
+WEIGHT_LOADING = os.environ.get("CLASSROOM_WEIGHTS", "copy")
+
+# ---------------- Backends ----------------
+# "torch" runs the checkpoint eagerly; "onnx" / "onnx-int8" run the graphs
+# written by `python onnx_export.py export` through ONNX Runtime on CPU;
+# "student" / "linear" run the compact models written by `python distill.py`;
+# "cascade" chains cheap stages in front of one of those (see below);
+# "remote" sends everything to `python inference_server.py serve`.
+BACKENDS = ("torch", "onnx", "onnx-int8", "student", "linear", "cascade", "remote")
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+
+# Distilled models live in these subdirectories of the teacher's model dir
+STUDENT_DIRS = {"student": "student", "linear": "linear"}
+LINEAR_FILE = "linear.joblib"
+
+BACKEND = os.environ.get("CLASSROOM_BACKEND", "torch")
+REMOTE_URL = os.environ.get("CLASSROOM_INFERENCE_URL", "http://127.0.0.1:8765")
+
+# Items per /classify_batch call and seconds to wait for one
+REMOTE_CHUNK = 1024
+REMOTE_TIMEOUT = 300
+# Times a call the server turns away as busy (503) is retried, after its Retry-After
+REMOTE_RETRIES = 30
+
+# Element types predict_proba / classify_proba can return
+PROBABILITY_DTYPES = ("float32", "float16")
+
+
+# Sequence-length policy. "full" truncates only at the model's own maximum;
+# "fast" caps every row at MAX_LENGTH tokens; "window" runs rows longer than
+# MAX_LENGTH as overlapping windows and averages their probabilities.
+LENGTH_MODES = ("full", "fast", "window")
+LENGTH_MODE = os.environ.get("CLASSROOM_LENGTH_MODE", "full")
+MAX_LENGTH = int(os.environ.get("CLASSROOM_MAX_LENGTH", "128"))
+MIN_MAX_LENGTH = 16
+
+# Cascade. Rows go through CASCADE_STAGES in order ("rules": the patterns in
+# cascade.py, "linear": the distilled linear model); a stage answers a row
+# when its confidence is at least that stage's threshold, and only rows no
+# stage is sure of are escalated to CASCADE_FINAL.
+CASCADE_STAGE_NAMES = ("rules", "linear")
+CASCADE_FINALS = ("torch", "onnx", "onnx-int8", "student")
+CASCADE_STAGES = tuple(
+    stage for stage in os.environ.get("CLASSROOM_CASCADE_STAGES", "rules,linear").split(",") if stage
+)
+CASCADE_THRESHOLDS = {
+    "rules": float(os.environ.get("CLASSROOM_CASCADE_RULES_THRESHOLD", "0.9")),
+    "linear": float(os.environ.get("CLASSROOM_CASCADE_LINEAR_THRESHOLD", "0.9")),
+}
+CASCADE_FINAL = os.environ.get("CLASSROOM_CASCADE_FINAL", "torch")
+
+
+def check_length_policy(mode: str, max_length: int = None):
+    """ValueError unless `mode` is one of LENGTH_MODES and `max_length` is usable."""
+
+    if mode not in LENGTH_MODES:
+        raise ValueError(f"Unknown length mode {mode!r}; expected one of {LENGTH_MODES}")
+    if max_length is not None and max_length < MIN_MAX_LENGTH:
+        raise ValueError(f"max_length must be at least {MIN_MAX_LENGTH}")
+
+
+def set_length_policy(mode: str, max_length: int = None):
+    """
+    Switch the default sequence-length policy (see LENGTH_MODES) for this
+    whole process. Callers serving several users pass length_mode /
+    max_length to the predict functions instead.
+    """
+
+    global LENGTH_MODE, MAX_LENGTH
+
+    check_length_policy(mode, max_length)
+    LENGTH_MODE = mode
+    if max_length is not None:
+        MAX_LENGTH = int(max_length)
+
+
+def length_policy(length_mode: str = None, max_length: int = None):
+    """(mode, max length) with the process defaults filled in, checked."""
+
+    length_mode, max_length = length_mode or LENGTH_MODE, int(max_length or MAX_LENGTH)
+    check_length_policy(length_mode, max_length)
+    return length_mode, max_length
+
+
+def set_cascade(stages=None, thresholds=None, final: str = None):
+    """
+    Configure the "cascade" backend for this process: the stages to try,
+    {stage: threshold} overrides and the backend rows are escalated to.
+    """
+
+    global CASCADE_STAGES, CASCADE_THRESHOLDS, CASCADE_FINAL
+
+    if stages is not None:
+        unknown = set(stages) - set(CASCADE_STAGE_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown cascade stage(s) {sorted(unknown)}; expected some of {CASCADE_STAGE_NAMES}")
+        CASCADE_STAGES = tuple(stages)
+
+    if thresholds is not None:
+        for stage, threshold in thresholds.items():
+            if stage not in CASCADE_STAGE_NAMES:
+                raise ValueError(f"Unknown cascade stage {stage!r}; expected one of {CASCADE_STAGE_NAMES}")
+            if not 0.0 <= threshold <= 1.0:
+                raise ValueError(f"Cascade threshold for {stage!r} must be between 0 and 1")
+        CASCADE_THRESHOLDS = {**CASCADE_THRESHOLDS, **{stage: float(t) for stage, t in thresholds.items()}}
+
+    if final is not None:
+        if final not in CASCADE_FINALS:
+            raise ValueError(f"Cascade can't escalate to {final!r}; expected one of {CASCADE_FINALS}")
+        CASCADE_FINAL = final
+
+
+def set_backend(name: str):
+    """Switch the backend used by classify_text / predict_label for this process."""
+
+    global BACKEND
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}; expected one of {BACKENDS}")
+    BACKEND = name
+
+
+def onnx_path(backend: str, model_dir: str = None) -> str:
+    """Where the ONNX graph for `backend` lives inside `model_dir`."""
+    return os.path.join(model_dir or MODEL_DIR, "onnx", ONNX_FILES[backend])
+
+
+def student_dir(backend: str, model_dir: str = None) -> str:
+    """Where the distilled model for `backend` ("student" / "linear") lives."""
+    return os.path.join(model_dir or MODEL_DIR, STUDENT_DIRS[backend])
+
+
+def _has_files(name: str, model_dir: str = None) -> bool:
+    """Whether `name` can run with the files currently on disk."""
+    if name == "cascade":
+        return _has_files(CASCADE_FINAL, model_dir) and (
+            "linear" not in CASCADE_STAGES or _has_files("linear", model_dir)
+        )
+    return (
+        name == "torch"
+        or (name in ONNX_FILES and os.path.exists(onnx_path(name, model_dir)))
+        or (name == "student" and os.path.exists(os.path.join(student_dir(name, model_dir), "config.json")))
+        or (name == "linear" and os.path.exists(os.path.join(student_dir(name, model_dir), LINEAR_FILE)))
+        or (name == "remote" and "CLASSROOM_INFERENCE_URL" in os.environ)
+    )
+
+
+def available_backends(model_dir: str = None):
+    """Backends that can run with the files currently on disk."""
+    return [name for name in BACKENDS if _has_files(name, model_dir)]
+
+# ---------------- Lazy Model Registry ----------------
+# One entry per (model directory, backend), shared by every thread / session
+# in the process.
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def load_model(model_dir: str = None, backend: str = None):
+    """
+    Return the loaded bundle for `model_dir` and `backend`, loading it on first
+    use. Safe to call from several threads at once.
+
+    The bundle holds the (fast) tokenizer and its encoding LRU, the label
+    encoder, `id_to_label` (the label of each probability column, as a
+    numpy array), `max_tokens` (the longest input the model accepts), the
+    load time and `forward`, which maps padded numpy encodings to a numpy
+    logits array.
+    """
+
+    model_dir = model_dir or MODEL_DIR
+    backend = backend or BACKEND
+    key = (model_dir, backend)
+
+    bundle = _registry.get(key)
+    if bundle is not None:
+        return bundle
+
+    if backend == "cascade":
+        return _load_cascade(model_dir)
+
+    with _registry_lock:
+        bundle = _registry.get(key)
+        if bundle is None and backend == "remote":
+            # Nothing to load locally; the server owns the model
+            bundle = {
+                "tokenizer": None,
+                "encodings": None,
+                "label_encoder": None,
+                "id_to_label": None,
+                "max_tokens": None,
+                "model": None,
+                "forward": None,
+                "backend": backend,
+                "load_seconds": 0.0,
+            }
+            _registry[key] = bundle
+
+        if bundle is None:
+            start = time.perf_counter()
+
+            import joblib
+            import numpy as np
+            from tokenization import TokenCache, load_tokenizer, max_input_tokens
+
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+
+            # A distilled model brings its own tokenizer / label encoder
+            source_dir = student_dir(backend, model_dir) if backend in STUDENT_DIRS else model_dir
+            if backend in STUDENT_DIRS and not os.path.isdir(source_dir):
+                raise FileNotFoundError(f"{source_dir} not found; run `python distill.py {backend} ...` first")
+            label_encoder = joblib.load(f"{source_dir}/label_encoder.joblib")
+
+            if backend == "linear":
+                # TF-IDF + logistic regression straight on the text, no tokenizer
+                tokenizer = None
+                model, forward = joblib.load(os.path.join(source_dir, LINEAR_FILE)), None
+            else:
+                tokenizer = load_tokenizer(source_dir)
+                if backend in ONNX_FILES:
+                    model, forward = _load_onnx(onnx_path(backend, model_dir))
+                else:
+                    model, forward = _load_torch(source_dir)
+
+            bundle = {
+                "tokenizer": tokenizer,
+                "encodings": TokenCache(tokenizer, TOKEN_CACHE_ENTRIES) if tokenizer is not None else None,
+                "label_encoder": label_encoder,
+                "id_to_label": np.asarray(label_encoder.classes_).astype(str),
+                "max_tokens": max_input_tokens(tokenizer, source_dir) if tokenizer is not None else None,
+                "model": model,
+                "forward": forward,
+                "backend": backend,
+                "load_seconds": time.perf_counter() - start,
+            }
+            _registry[key] = bundle
+
+    return bundle
+
+
+def _load_cascade(model_dir: str):
+    """
+    The cascade has no model of its own: load its stages and the backend it
+    escalates to (each under its own registry entry), then register a bundle
+    carrying their label encoder.
+    """
+
+    start = time.perf_counter()
+    final = load_model(model_dir, CASCADE_FINAL)
+    if "linear" in CASCADE_STAGES:
+        load_model(model_dir, "linear")
+
+    with _registry_lock:
+        bundle = _registry.setdefault((model_dir, "cascade"), {
+            "tokenizer": None,
+            "encodings": None,
+            "label_encoder": final["label_encoder"],
+            "id_to_label": final["id_to_label"],
+            "max_tokens": final["max_tokens"],
+            "model": None,
+            "forward": None,
+            "backend": "cascade",
+            "load_seconds": time.perf_counter() - start,
+        })
+    return bundle
+
+
+def _load_torch(model_dir: str):
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    if WEIGHT_LOADING == "mmap":
+        from shared_weights import load_mmap_model
+        model = load_mmap_model(model_dir)
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+        model.eval()
+
+    def forward(inputs):
+        with torch.inference_mode():
+            outputs = model(**{name: torch.from_numpy(array) for name, array in inputs.items()})
+        return outputs.logits.float().numpy()
+
+    return model, forward
+
+
+def _load_onnx(path: str):
+    import numpy as np
+    import onnxruntime as ort
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run `python onnx_export.py export --int8` first")
+
+    options = ort.SessionOptions()
+    # 0 lets ONNX Runtime pick; worker processes pin this to their share of cores
+    options.intra_op_num_threads = int(os.environ.get("CLASSROOM_NUM_THREADS", "0"))
+
+    session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+    input_names = [node.name for node in session.get_inputs()]
+
+    def forward(inputs):
+        feed = {name: inputs[name].astype(np.int64) for name in input_names}
+        return session.run(None, feed)[0]
+
+    return session, forward
+
+
+def is_loaded(model_dir: str = None, backend: str = None):
+    """True once the model for `model_dir` / `backend` is in memory."""
+    return (model_dir or MODEL_DIR, backend or BACKEND) in _registry
+
+
+def warm_up(model_dir: str = None, backend: str = None):
+    """
+    Start loading the model in a background daemon thread and return the thread.
+    Does nothing (returns None) if it is already loaded.
+    """
+
+    backend = backend or BACKEND
+    if is_loaded(model_dir, backend):
+        return None
+
+    thread = threading.Thread(
+        target=load_model, args=(model_dir, backend), name="model-warm-up", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+# ---------------- Prediction Cache ----------------
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide PredictionCache, or None when caching is switched off."""
+
+    global _cache
+
+    if not USE_CACHE:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            from prediction_cache import PredictionCache
+            _cache = PredictionCache()
+
+    return _cache
+
+
+def _cache_namespace(backend: str, length_mode: str = None, max_length: int = None) -> str:
+    """Checksum of everything that determines a prediction for `backend` under a length policy."""
+
+    from prediction_cache import model_checksum
+
+    if backend == "cascade":
+        from cascade import RULES_VERSION
+
+        # Everything the escalated rows depend on, then how rows are routed
+        namespace = f"{_cache_namespace(CASCADE_FINAL, length_mode, max_length)}:cascade"
+        for stage in CASCADE_STAGES:
+            namespace += f":{stage}{CASCADE_THRESHOLDS[stage]}"
+            namespace += f"v{RULES_VERSION}" if stage == "rules" else "@" + model_checksum(student_dir(stage))
+        return namespace
+
+    namespace = f"{model_checksum(MODEL_DIR)}:{backend}"
+    if backend in ONNX_FILES:
+        namespace += ":" + model_checksum(os.path.dirname(onnx_path(backend)))
+    if backend in STUDENT_DIRS:
+        namespace += ":" + model_checksum(student_dir(backend))
+    length_mode, max_length = length_policy(length_mode, max_length)
+    if length_mode != "full":
+        namespace += f":{length_mode}{max_length}"
+    return namespace
+
+
+def model_version(backend: str = None, length_mode: str = None, max_length: int = None) -> str:
+    """
+    Identifies the predictions of the current model files + `backend`
+    (default: BACKEND) under a length policy (default: the process's).
+    """
+    return _cache_namespace(backend or BACKEND, length_mode, max_length)
+
+
+def _model_texts(pairs):
+    """The texts the model sees for (role, utterance) pairs, unchanged from the input."""
+    return [str(utterance) if role is None else f"{role}: {utterance}" for role, utterance in pairs]
+
+
+def _cache_keys(pairs, length_mode: str = None, max_length: int = None):
+    from prediction_cache import cache_key, normalize_utterance
+
+    # Only the key is whitespace-normalized: re-spaced copies of an utterance
+    # share one entry, but the model always gets the text as written
+    checksum = _cache_namespace(BACKEND, length_mode, max_length)
+    return [cache_key(checksum, role, normalize_utterance(utterance)) for role, utterance in pairs]
+
+
+def _run_uncached(cache, keys, texts, cached, batch_size: int, length_mode: str = None, max_length: int = None):
+    """
+    Run each distinct key missing from `cached` through the model once and
+    store it, distribution included. Returns ({key: (label, confidence)},
+    {key: distribution}) for those keys.
+    """
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    if not missing:
+        return {}, {}
+
+    import numpy as np
+
+    probabilities = _probabilities(
+        list(missing.values()), batch_size, length_mode=length_mode, max_length=max_length
+    ).astype(np.float32, copy=False)
+    labels, confidences = _decode(probabilities, load_model()["id_to_label"])
+
+    fresh = dict(zip(missing, zip(labels.tolist(), confidences.tolist())))
+    distributions = dict(zip(missing, probabilities))
+    with perf.span("cache_store"):
+        cache.put_many(fresh, distributions)
+    return fresh, distributions
+
+
+def _classify_cached(pairs, batch_size: int = DEFAULT_BATCH_SIZE, length_mode: str = None, max_length: int = None):
+    """
+    Classify (role, utterance) pairs, checking the prediction cache first.
+    `role` is None for bare texts, which are sent to the model unchanged;
+    otherwise the model sees "role: utterance". `length_mode` /
+    `max_length` default to the process's policy.
+
+    Utterances that differ only in whitespace share a cache entry, so a hit
+    returns the prediction for whichever spelling was classified first;
+    with the cache off (CLASSROOM_CACHE=0) every text is run as written.
+    """
+
+    texts = _model_texts(pairs)
+
+    # The server has its own cache
+    if BACKEND == "remote":
+        with perf.span("remote"):
+            return _classify_remote(pairs, length_mode, max_length)
+
+    cache = get_cache()
+    if cache is None:
+        return _run_model(texts, batch_size, length_mode=length_mode, max_length=max_length)
+
+    with perf.span("cache_lookup"):
+        keys = _cache_keys(pairs, length_mode, max_length)
+        cached = cache.get_many(keys)
+
+    cached.update(_run_uncached(cache, keys, texts, cached, batch_size, length_mode, max_length)[0])
+    return [cached[key] for key in keys]
+
+
+def _probabilities_cached(pairs, batch_size: int = DEFAULT_BATCH_SIZE,
+                          length_mode: str = None, max_length: int = None):
+    """
+    _classify_cached for whole distributions: (float32 (n pairs, n classes)
+    matrix, id_to_label). Cached entries stored without a distribution are
+    run again.
+    """
+
+    import numpy as np
+
+    texts = _model_texts(pairs)
+
+    if BACKEND == "remote":
+        with perf.span("remote"):
+            return _probabilities_remote(pairs, length_mode, max_length)
+
+    id_to_label = load_model()["id_to_label"]
+    if not texts:
+        return np.empty((0, len(id_to_label)), dtype=np.float32), id_to_label
+
+    cache = get_cache()
+    if cache is None:
+        probabilities = _probabilities(texts, batch_size, length_mode=length_mode, max_length=max_length)
+        return probabilities.astype(np.float32, copy=False), id_to_label
+
+    with perf.span("cache_lookup"):
+        keys = _cache_keys(pairs, length_mode, max_length)
+        cached = cache.get_distributions(keys)
+
+    cached.update(_run_uncached(cache, keys, texts, cached, batch_size, length_mode, max_length)[1])
+    return np.stack([cached[key] for key in keys]), id_to_label
+
+
+def _post_remote(pairs, length_mode: str = None, max_length: int = None, **options):
+    """
+    Yield the /classify_batch response for each REMOTE_CHUNK of pairs (at
+    least one call). A length policy given here is sent along; otherwise
+    the server applies its own. A busy server's 503 is retried after its
+    Retry-After, up to REMOTE_RETRIES times.
+    """
+
+    import json
+    import urllib.error
+    import urllib.request
+
+    if length_mode is not None:
+        options["length_mode"] = length_mode
+    if max_length is not None:
+        options["max_length"] = int(max_length)
+
+    for start in range(0, max(len(pairs), 1), REMOTE_CHUNK):
+        items = [
+            {"role": role, "utterance": utterance}
+            for role, utterance in pairs[start:start + REMOTE_CHUNK]
+        ]
+        request = urllib.request.Request(
+            f"{REMOTE_URL.rstrip('/')}/classify_batch",
+            data=json.dumps({"items": items, **options}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        for attempt in range(REMOTE_RETRIES + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=REMOTE_TIMEOUT) as response:
+                    body = json.load(response)
+                break
+            except urllib.error.HTTPError as exc:
+                if exc.code != 503 or attempt == REMOTE_RETRIES:
+                    raise
+                time.sleep(float(exc.headers.get("Retry-After") or 1))
+        yield body
+
+
+def _classify_remote(pairs, length_mode: str = None, max_length: int = None):
+    """Send (role, utterance) pairs to the inference server's /classify_batch."""
+
+    results = []
+    for body in _post_remote(pairs, length_mode, max_length):
+        results += [(item["label"], float(item["confidence"])) for item in body["results"]]
+
+    return results
+
+
+def _probabilities_remote(pairs, length_mode: str = None, max_length: int = None):
+    """(probabilities, id_to_label) for (role, utterance) pairs from the inference server."""
+
+    import numpy as np
+
+    id_to_label, rows = None, []
+    for body in _post_remote(pairs, length_mode, max_length, probabilities=True):
+        id_to_label = np.asarray(body["labels"]).astype(str)
+        rows += body["probabilities"]
+
+    return np.asarray(rows, dtype=np.float32).reshape(len(rows), len(id_to_label)), id_to_label
 
-# ---------------- Load Model ----------------
-model = AutoModelForSequenceClassification.from_pretrained(MODEL_DIR)
-model.eval()
 
 # ---------------- Main Classification Function ----------------
 def classify_text(text: str):
     """Return predicted class + confidence score"""
 
-    inputs = tokenizer(text, padding=True, truncation=True, return_tensors="pt")
+    return _classify_cached([(None, text)])[0]
+
+
+# ---------------- Batched Classification ----------------
+def classify_batch(texts, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Classify many texts at once. Returns a list of (label, confidence)
+    in the same order as `texts`.
+    """
+
+    return _classify_cached([(None, text) for text in texts], batch_size)
+
+
+def _run_model(texts, batch_size: int = DEFAULT_BATCH_SIZE, backend: str = None,
+               length_mode: str = None, max_length: int = None, model_dir: str = None):
+    """
+    Run the model in `model_dir` over `texts`, bypassing the cache. Returns
+    one (label, confidence) per text.
+    """
+
+    texts = [str(t) for t in texts]
+    if not texts:
+        return []
+
+    probabilities = _probabilities(texts, batch_size, backend, length_mode, max_length, model_dir)
+    labels, confidences = _decode(probabilities, load_model(model_dir, backend)["id_to_label"])
+
+    return list(zip(labels.tolist(), confidences.tolist()))
+
+
+def _decode(probabilities, id_to_label):
+    """(labels, confidences) arrays for the most likely class of every row."""
+
+    import numpy as np
+
+    with perf.span("decode"):
+        predicted_classes = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(probabilities)), predicted_classes]
+        return id_to_label[predicted_classes], confidences.astype(np.float64)
+
 
-    with torch.no_grad():
-        outputs = model(**inputs)
+def _probabilities(texts, batch_size: int = DEFAULT_BATCH_SIZE, backend: str = None,
+                   length_mode: str = None, max_length: int = None, model_dir: str = None):
+    """
+    (n texts, n classes) class probabilities, columns in label-encoder order.
+
+    Texts are encoded in one batch call (repeats come from the bundle's
+    LRU), sorted by token length and run in buckets of `batch_size`, so
+    each forward pass is padded only to the longest text in its own bucket.
+    `length_mode` / `max_length` default to LENGTH_MODE / MAX_LENGTH;
+    max_length is capped at the model's own maximum.
+    """
+
+    import numpy as np
+
+    bundle = load_model(model_dir, backend)
+    tokenizer, forward, encodings = bundle["tokenizer"], bundle["forward"], bundle["encodings"]
+
+    if bundle["backend"] == "linear":
+        with perf.span("forward"):
+            return bundle["model"].predict_proba(texts)
+
+    if bundle["backend"] == "cascade":
+        return _cascade_probabilities(texts, batch_size, length_mode, max_length, model_dir)
+
+    # Untruncated, so windows can cover the whole of a long row
+    encoded = encodings.encode(texts)
+    length_mode, max_length = length_policy(length_mode, max_length)
+    max_length = min(max_length, bundle["max_tokens"])
 
-    logits = outputs.logits
-    probabilities = torch.softmax(logits, dim=1)
-    confidence, predicted_class = torch.max(probabilities, dim=1)
+    owners = None
+    if length_mode == "fast":
+        encoded, truncated = encoded.truncated(max_length, encodings.head, encodings.tail)
+        perf.count("truncated_rows", truncated)
+    elif length_mode == "window":
+        encoded, owners = encoded.windows(max_length, encodings.head, encodings.tail)
+        perf.count("extra_windows", len(encoded) - len(texts))
+    else:
+        encoded, _ = encoded.truncated(bundle["max_tokens"], encodings.head, encodings.tail)
 
-    label = label_encoder.inverse_transform([predicted_class.item()])[0]
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
 
-    return label, float(confidence)
+    # Shortest first, so neighbours in a bucket have similar lengths
+    order = np.argsort(encoded.lengths, kind="stable")
+    probabilities = None
+
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+
+        with perf.span("pad"):
+            inputs = encoded.padded(bucket, pad_id, tokenizer.padding_side)
+        perf.observe_batch(len(bucket), int(inputs["input_ids"].size))
+
+        with perf.span("forward"):
+            logits = forward(inputs)
+
+        with perf.span("decode"):
+            # Softmax, shifted by the row max for stability
+            exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+            if probabilities is None:
+                probabilities = np.empty((len(encoded), logits.shape[1]), dtype=exp.dtype)
+            probabilities[bucket] = exp / exp.sum(axis=1, keepdims=True)
+
+    if owners is not None:
+        with perf.span("decode"):
+            # A windowed row's distribution is the mean over its windows
+            summed = np.zeros((len(texts), probabilities.shape[1]), dtype=probabilities.dtype)
+            np.add.at(summed, owners, probabilities)
+            probabilities = summed / np.bincount(owners, minlength=len(texts))[:, None]
+
+    return probabilities
+
+
+def _cascade_probabilities(texts, batch_size: int = DEFAULT_BATCH_SIZE,
+                           length_mode: str = None, max_length: int = None, model_dir: str = None):
+    """
+    _probabilities for the cascade: each stage sees only the rows earlier
+    stages were unsure of, and what is left runs on CASCADE_FINAL. Rows
+    answered per stage are counted as "cascade_<stage>" / "cascade_escalated".
+    """
+
+    import numpy as np
+
+    import cascade
+
+    classes = list(load_model(model_dir, "cascade")["label_encoder"].classes_)
+    probabilities = np.zeros((len(texts), len(classes)), dtype=np.float32)
+    pending = np.arange(len(texts))
+
+    for stage in CASCADE_STAGES:
+        if not len(pending):
+            break
+        stage_texts = [texts[i] for i in pending]
+        if stage == "rules":
+            with perf.span("rules"):
+                stage_probabilities = cascade.rule_probabilities(stage_texts, classes)
+        else:
+            stage_probabilities = _probabilities(stage_texts, batch_size, backend=stage, model_dir=model_dir)
+
+        sure = stage_probabilities.max(axis=1) >= CASCADE_THRESHOLDS[stage]
+        probabilities[pending[sure]] = stage_probabilities[sure]
+        perf.count(f"cascade_{stage}", int(sure.sum()))
+        pending = pending[~sure]
+
+    if len(pending):
+        probabilities[pending] = _probabilities(
+            [texts[i] for i in pending], batch_size, CASCADE_FINAL, length_mode, max_length, model_dir
+        )
+    perf.count("cascade_escalated", len(pending))
+
+    return probabilities
 
 
 # ---------------- Predict Label for Role + Utterance ----------------
@@ -39,8 +740,95 @@ def predict_label(role: str, utterance: str):
     Example: 'Teacher: What is photosynthesis?'
     """
 
-    combined_text = f"{role}: {utterance}"
-
-    label, _ = classify_text(combined_text)
+    label, _ = _classify_cached([(str(role), utterance)])[0]
 
     return label
+
+
+def predict_labels(roles, utterances, batch_size: int = DEFAULT_BATCH_SIZE,
+                   length_mode: str = None, max_length: int = None):
+    """
+    Batched form of predict_label for whole Role / Utterance columns.
+    Returns one label per row, in row order. `length_mode` / `max_length`
+    override the process's length policy for this call only.
+    """
+
+    return [label for label, _ in predict_batch(roles, utterances, batch_size, length_mode, max_length)]
+
+
+def predict_batch(roles, utterances, batch_size: int = DEFAULT_BATCH_SIZE,
+                  length_mode: str = None, max_length: int = None):
+    """Like predict_labels, but returns (label, confidence) per row."""
+
+    pairs = [(str(role), utterance) for role, utterance in zip(roles, utterances)]
+
+    return _classify_cached(pairs, batch_size, length_mode, max_length)
+
+
+# ---------------- Class Distributions ----------------
+def predict_proba(roles, utterances, batch_size: int = DEFAULT_BATCH_SIZE, dtype: str = "float32",
+                  length_mode: str = None, max_length: int = None):
+    """
+    Class distributions for whole Role / Utterance columns:
+    (probabilities, id_to_label), an (n rows, n classes) matrix of `dtype`
+    ("float32" or "float16") and the label of each of its columns. Goes
+    through the prediction cache like predict_batch, and takes the same
+    length policy overrides.
+    """
+
+    if dtype not in PROBABILITY_DTYPES:
+        raise ValueError(f"Unknown dtype {dtype!r}; expected one of {PROBABILITY_DTYPES}")
+
+    pairs = [(str(role), utterance) for role, utterance in zip(roles, utterances)]
+    probabilities, id_to_label = _probabilities_cached(pairs, batch_size, length_mode, max_length)
+
+    return probabilities.astype(dtype, copy=False), id_to_label
+
+
+def classify_proba(texts, batch_size: int = DEFAULT_BATCH_SIZE, dtype: str = "float32"):
+    """predict_proba for bare texts (as classify_batch is to predict_batch)."""
+
+    if dtype not in PROBABILITY_DTYPES:
+        raise ValueError(f"Unknown dtype {dtype!r}; expected one of {PROBABILITY_DTYPES}")
+
+    probabilities, id_to_label = _probabilities_cached([(None, text) for text in texts], batch_size)
+
+    return probabilities.astype(dtype, copy=False), id_to_label
+
+
+def distribution_columns(probabilities, id_to_label, top_k: int = 1, margin: bool = False):
+    """
+    DataFrame of the `top_k` classes of each row, most likely first:
+    Predicted_Label / Confidence, then Runner_Up_Label / Runner_Up_Confidence,
+    then Label_<rank> / Confidence_<rank>. With `margin`, a Margin column
+    holds the gap between the two most likely classes (small = uncertain).
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    probabilities = np.asarray(probabilities)
+    top_k = max(1, min(top_k, probabilities.shape[1]))
+    rows = np.arange(len(probabilities))[:, None]
+
+    # Highest first; ties keep column order
+    ranked = np.argsort(-probabilities, axis=1, kind="stable")[:, :max(top_k, 2 if margin else 1)]
+    ranked_probabilities = probabilities[rows, ranked].astype(np.float32, copy=False)
+
+    columns = {}
+    for rank in range(top_k):
+        label_column, confidence_column = (
+            ("Predicted_Label", "Confidence") if rank == 0
+            else ("Runner_Up_Label", "Runner_Up_Confidence") if rank == 1
+            else (f"Label_{rank + 1}", f"Confidence_{rank + 1}")
+        )
+        columns[label_column] = id_to_label[ranked[:, rank]]
+        columns[confidence_column] = ranked_probabilities[:, rank]
+
+    if margin:
+        columns["Margin"] = (
+            ranked_probabilities[:, 0] - ranked_probabilities[:, 1] if ranked.shape[1] > 1
+            else ranked_probabilities[:, 0]
+        )
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,363 @@
+"""
+Local HTTP service around the classroom utterance classifier.
+
+    python inference_server.py serve --port 8765 --window-ms 5 --max-batch 32
+    python inference_server.py replay utterances.jsonl --url http://127.0.0.1:8765
+
+Endpoints:
+    POST /classify        {"text": ...} or {"role": ..., "utterance": ...}
+    POST /classify_batch  {"texts": [...]} or {"items": [{"role": ..., "utterance": ...}, ...]}
+                          add "probabilities": true for {"labels": [...], "probabilities": [[...], ...]}
+                          and "length_mode" / "max_length" to override the server's length policy
+    GET  /metrics         Prometheus text format
+    GET  /health
+
+Concurrent /classify calls are coalesced into micro-batches: the first
+request opens a window of --window-ms, and everything that arrives within
+it (up to --max-batch) runs through the model in one forward pass. Once
+--max-queue requests are waiting, new ones get 503 so clients back off.
+/classify_batch calls run in --max-batch sized forward passes, taking turns
+with the micro-batches, and past --max-batch-requests at once they get 503
+too.
+
+Point the Streamlit pages at a running server with
+CLASSROOM_BACKEND=remote CLASSROOM_INFERENCE_URL=http://127.0.0.1:8765
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import inference
+import perf
+from perf import Histogram
+from shared_weights import WEIGHT_FILE, memory_usage
+
+DEFAULT_PORT = 8765
+DEFAULT_WINDOW_MS = 5.0
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_QUEUE = 1024
+DEFAULT_MAX_BATCH_REQUESTS = 2
+
+# The server itself can't use the remote backend
+LOCAL_BACKENDS = [b for b in inference.BACKENDS if b != "remote"]
+
+# Largest /classify_batch request accepted in one call
+MAX_BATCH_ITEMS = 4096
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+# ---------------- Micro-Batching ----------------
+class MicroBatcher:
+    """
+    Collects single (role, utterance) requests into batches and runs them on
+    one model thread. `submit` raises asyncio.QueueFull when the queue is full.
+    """
+
+    def __init__(self, window: float, max_batch: int, max_queue: int, executor):
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = executor
+        self.batch_sizes = Histogram(
+            "classroom_batch_size", "Utterances per forward pass.", BATCH_SIZE_BUCKETS
+        )
+
+    async def submit(self, pair):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((pair, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            pairs = [pair for pair, _ in batch]
+            self.batch_sizes.observe(len(pairs))
+
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, inference._classify_cached, pairs, self.max_batch
+                )
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+# ---------------- HTTP App ----------------
+def _pair(item):
+    """(role, utterance) from a request item; role is None for bare texts."""
+
+    if isinstance(item, str):
+        return None, item
+    if not isinstance(item, dict):
+        # The handlers answer TypeError with 400 Bad Request
+        raise TypeError(f"expected an object or a string, got {type(item).__name__}")
+    if "text" in item:
+        return None, str(item["text"])
+    role = item.get("role")
+    return (None if role is None else str(role)), str(item["utterance"])
+
+
+def _result(label, confidence):
+    return {"label": label, "confidence": confidence}
+
+
+def create_app(window_ms: float = DEFAULT_WINDOW_MS, max_batch: int = DEFAULT_MAX_BATCH, max_queue: int = DEFAULT_MAX_QUEUE,
+               max_batch_requests: int = DEFAULT_MAX_BATCH_REQUESTS):
+    from aiohttp import web
+
+    # One thread: forward passes never compete with each other for cores
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+    batcher = MicroBatcher(window_ms / 1000.0, max_batch, max_queue, executor)
+    latency = Histogram(
+        "classroom_request_latency_seconds", "Request latency by endpoint.", LATENCY_BUCKETS
+    )
+    rejected = {"count": 0}
+    # /classify_batch calls allowed in flight at once
+    batch_slots = asyncio.Semaphore(max(1, max_batch_requests))
+
+    @web.middleware
+    async def timed(request, handler):
+        start = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            # Route, not raw path, so unknown URLs can't blow up the label set
+            resource = request.match_info.route.resource
+            latency.observe(time.perf_counter() - start, resource.canonical if resource else "other")
+
+    async def classify(request):
+        try:
+            pair = _pair(await request.json())
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text="expected {\"text\": ...} or {\"role\": ..., \"utterance\": ...}")
+
+        try:
+            label, confidence = await batcher.submit(pair)
+        except asyncio.QueueFull:
+            rejected["count"] += 1
+            raise web.HTTPServiceUnavailable(text="queue full, retry later", headers={"Retry-After": "1"})
+
+        return web.json_response(_result(label, confidence))
+
+    async def classify_batch(request):
+        try:
+            body = await request.json()
+            items = body["texts"] if "texts" in body else body["items"]
+            pairs = [_pair(item) for item in items]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text="expected {\"texts\": [...]} or {\"items\": [...]}")
+
+        if len(pairs) > MAX_BATCH_ITEMS:
+            raise web.HTTPRequestEntityTooLarge(max_size=MAX_BATCH_ITEMS, actual_size=len(pairs))
+
+        # The client's length policy, for this request only
+        try:
+            policy = inference.length_policy(body.get("length_mode"), body.get("max_length"))
+        except (ValueError, TypeError) as exc:
+            raise web.HTTPBadRequest(text=str(exc))
+
+        if batch_slots.locked():
+            rejected["count"] += 1
+            raise web.HTTPServiceUnavailable(text="too many batch requests, retry later", headers={"Retry-After": "1"})
+
+        async with batch_slots:
+            # One max_batch pass at a time, so queued /classify micro-batches get
+            # the model thread in between instead of waiting for the whole request
+            loop = asyncio.get_running_loop()
+            fn = inference._probabilities_cached if body.get("probabilities") else inference._classify_cached
+            parts = []
+            for start in range(0, max(len(pairs), 1), max_batch):
+                chunk = pairs[start:start + max_batch]
+                parts.append(await loop.run_in_executor(executor, fn, chunk, max_batch, *policy))
+                if chunk:
+                    batcher.batch_sizes.observe(len(chunk))
+
+        if body.get("probabilities"):
+            return web.json_response({
+                "labels": parts[-1][1].tolist(),
+                "probabilities": [row for probabilities, _ in parts for row in probabilities.tolist()],
+            })
+
+        return web.json_response({"results": [_result(*result) for results in parts for result in results]})
+
+    async def metrics(request):
+        lines = latency.render()
+        lines += batcher.batch_sizes.render()
+        lines += [
+            "# HELP classroom_queue_depth Single requests waiting for a batch.",
+            "# TYPE classroom_queue_depth gauge",
+            f"classroom_queue_depth {batcher.queue.qsize()}",
+            "# HELP classroom_rejected_total Requests rejected because the queue or the batch slots were full.",
+            "# TYPE classroom_rejected_total counter",
+            f"classroom_rejected_total {rejected['count']}",
+        ]
+        # Stage timings and token / batch counters from the inference hot path
+        lines += perf.prometheus_lines()
+
+        # Unique vs shared memory of this replica, for sizing hosts
+        usage = memory_usage(os.path.join(inference.MODEL_DIR, WEIGHT_FILE))
+        if usage is not None:
+            lines += [
+                "# HELP classroom_memory_bytes Memory of this process by kind (from /proc/self/smaps).",
+                "# TYPE classroom_memory_bytes gauge",
+            ]
+            lines += [f'classroom_memory_bytes{{kind="{kind}"}} {mb * 2 ** 20:.0f}' for kind, mb in usage.items()]
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+    async def health(request):
+        return web.json_response({"status": "ok", "backend": inference.BACKEND})
+
+    async def start_batcher(app):
+        # Load before accepting traffic, so the first request isn't slow
+        await asyncio.get_running_loop().run_in_executor(executor, inference.load_model)
+        app["batcher_task"] = asyncio.create_task(batcher.run())
+
+    async def stop_batcher(app):
+        app["batcher_task"].cancel()
+        executor.shutdown(wait=False)
+
+    app = web.Application(middlewares=[timed])
+    app.router.add_post("/classify", classify)
+    app.router.add_post("/classify_batch", classify_batch)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/health", health)
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+    return app
+
+
+# ---------------- Replay Load Test ----------------
+def read_payloads(path: str):
+    """
+    /classify payloads from a jsonl file of {"text": ...} or
+    {"role": ..., "utterance": ...} records; ValueError names the first bad line.
+    """
+
+    payloads = []
+    with open(path, encoding="utf-8") as fh:
+        for number, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                raise ValueError(f"{path}:{number}: not valid JSON ({exc})")
+
+            if isinstance(record, dict) and "text" in record:
+                payloads.append({"text": record["text"]})
+            elif isinstance(record, dict) and "utterance" in record:
+                payloads.append({"role": record.get("role"), "utterance": record["utterance"]})
+            else:
+                raise ValueError(f"{path}:{number}: expected a record with a \"text\" or \"utterance\" field")
+    return payloads
+
+
+async def replay(payloads, url: str, concurrency: int, repeat: int):
+    """
+    Send every payload to /classify with `concurrency` clients and report
+    throughput and latency percentiles.
+    """
+
+    import aiohttp
+
+    payloads = payloads * repeat
+
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    latencies = []
+    errors = {"count": 0}
+
+    async def client(session):
+        while not queue.empty():
+            payload = queue.get_nowait()
+            start = time.perf_counter()
+            async with session.post(f"{url}/classify", json=payload) as response:
+                await response.read()
+                if response.status != 200:
+                    errors["count"] += 1
+                    continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000 if latencies else float("nan")
+
+    print(f"requests: {len(payloads)}  errors: {errors['count']}  elapsed: {elapsed:.2f}s")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency ms  p50: {percentile(0.50):.1f}  p95: {percentile(0.95):.1f}  p99: {percentile(0.99):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the HTTP service")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--window-ms", type=float, default=DEFAULT_WINDOW_MS)
+    serve.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    serve.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    serve.add_argument("--max-batch-requests", type=int, default=DEFAULT_MAX_BATCH_REQUESTS,
+                       help="/classify_batch calls served at once; more get 503")
+    serve.add_argument("--backend", choices=LOCAL_BACKENDS,
+                       default=inference.BACKEND if inference.BACKEND in LOCAL_BACKENDS else "torch")
+
+    load = commands.add_parser("replay", help="replay a jsonl file against a running service")
+    load.add_argument("jsonl")
+    load.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--repeat", type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        from aiohttp import web
+
+        inference.set_backend(args.backend)
+        web.run_app(
+            create_app(args.window_ms, args.max_batch, args.max_queue, args.max_batch_requests),
+            host=args.host, port=args.port,
+        )
+    else:
+        try:
+            payloads = read_payloads(args.jsonl)
+        except ValueError as exc:
+            parser.error(str(exc))
+        asyncio.run(replay(payloads, args.url.rstrip("/"), args.concurrency, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
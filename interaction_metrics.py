@@ -0,0 +1,190 @@
+import numpy as np
+
+# Vectorized PNR / IDIR / CBI / quadrant computation over whole columns of
+# per-class label counts, shared by the PNR-IDIR page and batch jobs.
+#
+#   PNR  = Response / Instruction
+#   IDIR = (Response + Question) / (Lecture + Instruction)
+#   CBI  = alpha * PNR + beta * IDIR
+
+DEFAULT_ALPHA = 0.45
+DEFAULT_BETA = 0.55
+
+# What a ratio with a zero denominator becomes:
+#   "nan"  - undefined; left out of min / max, plots and quadrants
+#   "zero" - 0
+#   "cap"  - x / 0 with x > 0 becomes the largest finite ratio in the
+#            column (or `cap` if given); 0 / 0 becomes 0
+ZERO_POLICIES = ("nan", "zero", "cap")
+
+QUADRANTS = np.array(["Q1", "Q2", "Q3", "Q4"])
+UNDEFINED_QUADRANT = "NA"
+
+
+# ---------------- Ratios ----------------
+def safe_ratio(numerator, denominator, policy: str = "nan", cap: float = None):
+    """Element-wise numerator / denominator with an explicit zero-denominator policy."""
+
+    if policy not in ZERO_POLICIES:
+        raise ValueError(f"Unknown zero policy {policy!r}; expected one of {ZERO_POLICIES}")
+
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+
+    zero = denominator == 0
+    ratio = np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=~zero)
+
+    if policy == "zero":
+        ratio[zero] = 0.0
+    elif policy == "cap":
+        if cap is None:
+            finite = ratio[np.isfinite(ratio)]
+            cap = float(finite.max()) if finite.size else 1.0
+        ratio[zero] = np.where(numerator[zero] > 0, cap, 0.0)
+
+    return ratio
+
+
+def pnr(response, instruction, policy: str = "nan"):
+    return safe_ratio(response, instruction, policy)
+
+
+def idir(lecture, instruction, question, response, policy: str = "nan"):
+    return safe_ratio(
+        np.asarray(response, dtype=np.float64) + np.asarray(question, dtype=np.float64),
+        np.asarray(lecture, dtype=np.float64) + np.asarray(instruction, dtype=np.float64),
+        policy,
+    )
+
+
+def cbi(pnr_values, idir_values, alpha: float = DEFAULT_ALPHA, beta: float = DEFAULT_BETA):
+    return alpha * np.asarray(pnr_values, dtype=np.float64) + beta * np.asarray(idir_values, dtype=np.float64)
+
+
+# ---------------- Quadrants ----------------
+def quadrant_codes(pnr_values, idir_values, threshold: float = 1.0):
+    """
+    0..3 for Q1..Q4, -1 where either ratio is undefined.
+
+    Q1: PNR >= 1, IDIR >= 1    Q2: PNR < 1, IDIR >= 1
+    Q3: PNR < 1,  IDIR < 1     Q4: PNR >= 1, IDIR < 1
+    """
+
+    pnr_values = np.asarray(pnr_values, dtype=np.float64)
+    idir_values = np.asarray(idir_values, dtype=np.float64)
+
+    high_pnr = pnr_values >= threshold
+    high_idir = idir_values >= threshold
+
+    codes = np.select(
+        [high_pnr & high_idir, ~high_pnr & high_idir, ~high_pnr & ~high_idir],
+        [0, 1, 2],
+        default=3,
+    ).astype(np.int8)
+    codes[np.isnan(pnr_values) | np.isnan(idir_values)] = -1
+    return codes
+
+
+def quadrant_labels(codes):
+    """'Q1'..'Q4' / 'NA' for an array of quadrant codes."""
+
+    codes = np.asarray(codes)
+    return np.where(codes >= 0, QUADRANTS[np.clip(codes, 0, 3)], UNDEFINED_QUADRANT)
+
+
+# ---------------- One-Pass Entry Points ----------------
+def compute_metrics(lecture, instruction, question, response, policy: str = "nan",
+                    alpha: float = DEFAULT_ALPHA, beta: float = DEFAULT_BETA):
+    """PNR, IDIR, CBI and quadrant codes for count arrays, in one vectorized pass."""
+
+    pnr_values = pnr(response, instruction, policy)
+    idir_values = idir(lecture, instruction, question, response, policy)
+
+    return {
+        "pnr": pnr_values,
+        "idir": idir_values,
+        "cbi": cbi(pnr_values, idir_values, alpha, beta),
+        "quadrant_code": quadrant_codes(pnr_values, idir_values),
+    }
+
+
+def add_metrics(df, policy: str = "nan", alpha: float = DEFAULT_ALPHA, beta: float = DEFAULT_BETA):
+    """
+    Copy of a consolidated sheet (Lecture / Instruction / Question / Response
+    columns) with pnr, idir, CBI and Quadrant added.
+    """
+
+    metrics = compute_metrics(
+        df["Lecture"].to_numpy(),
+        df["Instruction"].to_numpy(),
+        df["Question"].to_numpy(),
+        df["Response"].to_numpy(),
+        policy, alpha, beta,
+    )
+
+    out = df.copy()
+    out["pnr"] = metrics["pnr"]
+    out["idir"] = metrics["idir"]
+    out["CBI"] = metrics["cbi"]
+    out["Quadrant"] = quadrant_labels(metrics["quadrant_code"])
+    return out
+
+
+# ---------------- CBI Sweeps ----------------
+def alpha_grid(start: float = 0.0, stop: float = 1.0, step: float = 0.01):
+    """(alphas, betas) with alpha from start to stop inclusive and beta = 1 - alpha."""
+
+    alphas = np.round(np.arange(start, stop + step / 2, step), 10)
+    return alphas, np.round(1.0 - alphas, 10)
+
+
+def cbi_matrix(pnr_values, idir_values, alphas, betas):
+    """
+    CBI for every class under every (alpha, beta) weighting as one matrix
+    product: (n_classes x 2) @ (2 x n_weightings) -> (n_classes x n_weightings).
+    """
+
+    ratios = np.column_stack([
+        np.asarray(pnr_values, dtype=np.float64),
+        np.asarray(idir_values, dtype=np.float64),
+    ])
+    weights = np.vstack([
+        np.asarray(alphas, dtype=np.float64),
+        np.asarray(betas, dtype=np.float64),
+    ])
+    return ratios @ weights
+
+
+def rank_matrix(scores):
+    """
+    Rank of each class within each column of `scores` (1 = highest CBI).
+    Undefined (NaN) scores rank last.
+    """
+
+    scores = np.asarray(scores, dtype=np.float64)
+    n_classes = scores.shape[0]
+
+    order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), axis=0, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(
+        ranks, order, np.broadcast_to(np.arange(1, n_classes + 1)[:, None], order.shape), axis=0
+    )
+    return ranks
+
+
+def rank_stability(scores, top_k: int = 10):
+    """
+    Per-class rank statistics across all weightings of a sweep: mean,
+    standard deviation, best and worst rank, and the share of weightings
+    in which the class makes the top `top_k`.
+    """
+
+    ranks = rank_matrix(scores)
+
+    return {
+        "mean_rank": ranks.mean(axis=1),
+        "rank_std": ranks.std(axis=1),
+        "best_rank": ranks.min(axis=1),
+        "worst_rank": ranks.max(axis=1),
+        "top_k_share": (ranks <= top_k).mean(axis=1),
+    }
@@ -0,0 +1,369 @@
+import os
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+
+import pandas as pd
+
+import perf
+
+# Background jobs that outlive the Streamlit script run that submitted them.
+# One JobScheduler per server process (see page_cache.job_scheduler) owns a
+# fixed set of worker threads, so at most MAX_RUNNING_JOBS jobs classify at
+# once. Queued jobs are picked round-robin across sessions: a session with
+# ten jobs queued doesn't hold back another session's single job. A page
+# keeps the job ID in the URL (?job=...), so a refresh or a new tab finds the
+# job again to follow its progress, cancel it or download its result.
+
+MAX_RUNNING_JOBS = int(os.environ.get("CLASSROOM_MAX_JOBS", "1"))
+
+# Jobs one session may have waiting at once
+MAX_QUEUED_PER_SESSION = 5
+
+# Finished jobs (and their results) are kept this long
+JOB_TTL_SECONDS = 60 * 60
+
+# Classified rows kept for the live preview of a running job
+PREVIEW_ROWS = 20
+
+# Columns classify_workbook adds to every row; all come from one forward pass
+OUTPUT_COLUMNS = ("Predicted_Label", "Confidence", "Runner_Up_Label")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's function when the job has been cancelled."""
+
+
+class Job:
+    """
+    One unit of background work. `fn(job)` runs on a worker thread and
+    reports through the job: progress(), add_partial(), check_cancelled().
+    What it returns becomes `result`; `key` says what that result belongs to
+    (e.g. the upload it classifies).
+    """
+
+    def __init__(self, fn, session: str, name: str, key=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.fn = fn
+        self.session = session
+        self.name = name
+        self.key = key
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.perf_run = None
+        self.partial_counts = Counter()
+        self.preview = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    # ---- called from the job's own thread ----
+    def progress(self, done: int, total: int = None):
+        with self._lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+
+    def add_partial(self, chunk, label_column: str = "Predicted_Label"):
+        """Fold a classified chunk into the running label counts and preview."""
+
+        with self._lock:
+            self.partial_counts.update(chunk[label_column].value_counts().to_dict())
+            if self.preview is None or len(self.preview) < PREVIEW_ROWS:
+                head = chunk.head(PREVIEW_ROWS)
+                self.preview = head if self.preview is None else pd.concat([self.preview, head]).head(PREVIEW_ROWS)
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    # ---- called from pages ----
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelling(self) -> bool:
+        return self._cancel.is_set() and self.status not in FINISHED
+
+    def eta_seconds(self):
+        """Seconds left at the rate so far, or None before there is a rate."""
+
+        with self._lock:
+            if self.status != RUNNING or not self.total or not self.done:
+                return None
+            rate = self.done / max(time.time() - self.started, 1e-9)
+            return max(self.total - self.done, 0) / rate
+
+    def snapshot(self):
+        """Consistent copy of the progress fields for rendering."""
+
+        with self._lock:
+            return {
+                "status": self.status,
+                "done": self.done,
+                "total": self.total,
+                "partial_counts": dict(self.partial_counts),
+                "preview": self.preview,
+            }
+
+
+class JobScheduler:
+    """Bounded pool of worker threads with per-session round-robin queues."""
+
+    def __init__(self, max_running: int = MAX_RUNNING_JOBS, ttl: float = JOB_TTL_SECONDS):
+        self.max_running = max(1, max_running)
+        self.ttl = ttl
+        self._jobs = {}
+        self._queues = OrderedDict()  # session -> deque of queued jobs, in turn order
+        self._condition = threading.Condition()
+
+        for i in range(self.max_running):
+            threading.Thread(target=self._work, name=f"classroom-job-{i}", daemon=True).start()
+
+    def submit(self, fn, session: str, name: str = "job", key=None) -> Job:
+        """Queue `fn(job)` for `session`; RuntimeError if that session's queue is full."""
+
+        with self._condition:
+            self._prune()
+            queue = self._queues.get(session)
+            if queue is not None and len(queue) >= MAX_QUEUED_PER_SESSION:
+                raise RuntimeError(f"{MAX_QUEUED_PER_SESSION} jobs are already waiting; cancel one or wait")
+
+            job = Job(fn, session, name, key)
+            self._jobs[job.id] = job
+            self._queues.setdefault(session, deque()).append(job)
+            self._condition.notify()
+        return job
+
+    def get(self, job_id: str):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        """Cancel a job: a queued one never starts, a running one stops at its next check."""
+
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return
+            job.cancel()
+            queue = self._queues.get(job.session)
+            if job.status == QUEUED and queue is not None and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.session]
+                job.status, job.finished = CANCELLED, time.time()
+
+    def position(self, job_id: str):
+        """How many jobs will start before this queued job (None unless it is queued)."""
+
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return None
+            # Replay the round-robin picks until this job comes up
+            queues = [list(queue) for queue in self._queues.values()]
+            ahead = 0
+            while queues:
+                queue = queues.pop(0)
+                if queue.pop(0) is job:
+                    return ahead
+                ahead += 1
+                if queue:
+                    queues.append(queue)
+            return ahead
+
+    def stats(self):
+        with self._condition:
+            statuses = Counter(job.status for job in self._jobs.values())
+        return {"running": statuses[RUNNING], "queued": statuses[QUEUED], "max_running": self.max_running}
+
+    # ---------------- Worker Side ----------------
+    def _next(self):
+        """The next job in round-robin order (caller holds the condition)."""
+
+        session, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        # This session goes to the back of the line
+        del self._queues[session]
+        if queue:
+            self._queues[session] = queue
+        return job
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queues:
+                    self._condition.wait()
+                job = self._next()
+                job.status, job.started = RUNNING, time.time()
+
+            # Spans the job records land in its own run, not a page's
+            job.perf_run = perf.begin_run(f"job:{job.name}")
+            try:
+                job.check_cancelled()
+                result = job.fn(job)
+            except JobCancelled:
+                job.status = CANCELLED
+            except Exception as exc:  # surfaced on the page
+                job.error = f"{type(exc).__name__}: {exc}"
+                job.status = FAILED
+            else:
+                job.result = result
+                job.status = DONE
+            finally:
+                job.finished = time.time()
+                perf.end_run(job.perf_run)
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.status in FINISHED and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+
+
+# ---------------- Workbook Classification ----------------
+def classify_workbook(job, data: bytes, name: str, chunk_rows: int, pool_size=None,
+                      store_name: str = None, incremental: bool = False, length_policy=(None, None)):
+    """
+    Job body behind the app page's "Run Excel Predictions": stream the
+    upload in chunks of `chunk_rows`, classify each (in this process, or in
+    a ShardPool of `pool_size` = (workers, threads per worker)) into
+    OUTPUT_COLUMNS, tee the
+    chunks into the columnar store as `store_name`, and return
+    {"xlsx", "totals", "label_counts", "notes"}. With `incremental`, only
+    rows added or edited since the stored version reach the model.
+    `length_policy` = (length mode, max length) applies to this job only;
+    None parts fall back to the process defaults.
+    """
+
+    from io import BytesIO
+
+    import inference
+    from incremental import PreviousVersion
+    from sharded import ShardPool
+    from storage import ClassifiedWriter, dataset_name
+    from streaming_io import count_rows, iter_chunks, write_xlsx
+
+    def upload():
+        buffer = BytesIO(data)
+        buffer.name = name
+        return buffer
+
+    length_mode, max_length = inference.length_policy(*length_policy)
+    version = inference.model_version(length_mode=length_mode, max_length=max_length)
+
+    with perf.span("count_rows"):
+        expected_rows = count_rows(upload())
+    job.progress(0, expected_rows)
+
+    # Running totals, so no full copy of the file is ever needed
+    totals = {"rows": 0, "teacher": 0, "student": 0, "classified": 0}
+    label_counter = Counter()
+    notes = []
+
+    # The last stored version of this dataset, if made by the same model
+    previous = None
+    if store_name and incremental:
+        previous = PreviousVersion.from_store(store_name, version)
+        if previous is None:
+            notes.append("♻️ No stored version from the current model — classifying every row")
+
+    pool = ShardPool(*pool_size) if pool_size else None
+    if pool is None:
+        inference.load_model()
+
+    def classify(part, done_before):
+        job.check_cancelled()
+        roles = part["Role"].astype(str).tolist()
+        utterances = part["Utterance"].astype(str).tolist()
+
+        # Includes the tokenize / forward / decode spans of the in-process path
+        with perf.span("classify"):
+            if pool is not None:
+                probabilities, id_to_label = pool.predict_proba(
+                    roles, utterances,
+                    progress=lambda done, _: job.progress(done_before + done),
+                    length_mode=length_mode, max_length=max_length,
+                )
+            else:
+                probabilities, id_to_label = inference.predict_proba(
+                    roles, utterances, length_mode=length_mode, max_length=max_length
+                )
+        totals["classified"] += len(part)
+        return inference.distribution_columns(probabilities, id_to_label, top_k=2)[list(OUTPUT_COLUMNS)]
+
+    def classified_chunks():
+        """Read, classify and hand on one chunk at a time."""
+
+        for chunk in iter_chunks(upload(), chunk_rows=chunk_rows * (pool.workers if pool is not None else 1)):
+            done_before = totals["rows"]
+            if previous is not None:
+                # Only added / edited rows reach the model
+                previous.patch(chunk, lambda part: classify(part, done_before))
+            else:
+                fresh = classify(chunk, done_before)
+                for column in OUTPUT_COLUMNS:
+                    chunk[column] = fresh[column].to_numpy()
+
+            role_lower = chunk["Role"].astype(str).str.lower()
+            totals["rows"] += len(chunk)
+            totals["teacher"] += int((role_lower == "teacher").sum())
+            totals["student"] += int((role_lower == "student").sum())
+            label_counter.update(chunk["Predicted_Label"].value_counts().to_dict())
+
+            job.progress(totals["rows"])
+            job.add_partial(chunk)
+            yield chunk
+
+    writer = ClassifiedWriter(store_name, metadata={"model_version": version}) if store_name else None
+
+    def stored_chunks():
+        for chunk in classified_chunks():
+            if writer is not None:
+                writer.write(chunk)
+            yield chunk
+
+    # The classified file (and the stored copy) are written as the chunks go by
+    try:
+        buffer = write_xlsx(stored_chunks())
+        job.check_cancelled()
+        if writer is not None:
+            writer.commit()
+            notes.append(f"💾 Saved {writer.rows} rows as dataset **{dataset_name(store_name)}**")
+    finally:
+        if writer is not None:
+            writer.discard()
+        if pool is not None:
+            pool.close()
+
+    counters = job.perf_run.counters if job.perf_run is not None else {}
+    if counters.get("truncated_rows"):
+        notes.append(f"✂️ {counters['truncated_rows']:.0f} rows truncated to {max_length} tokens")
+    if "cascade_escalated" in counters:
+        answered = {stage: counters.get(f"cascade_{stage}", 0) for stage in inference.CASCADE_STAGES}
+        notes.append(
+            "🪜 Cascade: " + " · ".join(f"{rows:.0f} by {stage}" for stage, rows in answered.items())
+            + f" · {counters['cascade_escalated']:.0f} escalated to {inference.CASCADE_FINAL}"
+        )
+    if previous is not None:
+        notes.append(
+            f"♻️ Incremental run: {totals['classified']} of {totals['rows']} rows classified · "
+            f"{totals['rows'] - totals['classified']} reused · {previous.removed()} removed"
+        )
+
+    return {
+        "xlsx": buffer.getvalue(),
+        "totals": totals,
+        "label_counts": pd.Series(label_counter, dtype="int64").sort_values(ascending=False),
+        "notes": notes,
+    }
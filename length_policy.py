@@ -0,0 +1,125 @@
+"""
+Pick a max sequence length from a corpus and check the "fast" (truncate)
+and "window" (sliding-window average) length modes against full-length
+inference before switching them on.
+
+    python length_policy.py profile transcripts.xlsx
+    python length_policy.py check transcripts.xlsx --mode fast --max-length 64
+    python length_policy.py check transcripts.xlsx --mode window --max-length 64
+
+Use a policy in the app with CLASSROOM_LENGTH_MODE / CLASSROOM_MAX_LENGTH,
+inference.set_length_policy(), or the app page's Execution Settings.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import inference
+
+# Coverages reported by `profile`, and the step suggested lengths round up to
+SUGGESTED_COVERAGES = (0.95, 0.99)
+LENGTH_STEP = 16
+
+
+def corpus_texts(roles, utterances):
+    """The exact strings predict_labels sends to the model."""
+    return [f"{role}: {utterance}" for role, utterance in zip(roles, utterances)]
+
+
+def token_lengths(texts):
+    """Full-length token count of every text (special tokens included)."""
+    return inference.load_model()["encodings"].encode(texts).lengths
+
+
+def suggest_max_length(lengths, coverage: float = 0.99, step: int = LENGTH_STEP) -> int:
+    """Smallest multiple of `step` that fits `coverage` of the rows untruncated."""
+
+    needed = int(np.ceil(np.quantile(lengths, coverage)))
+    return max(inference.MIN_MAX_LENGTH, int(np.ceil(needed / step) * step))
+
+
+def length_profile(lengths):
+    """Percentiles, suggested caps and the rows a 64 / 128 cap would cut."""
+
+    lengths = np.asarray(lengths)
+    return {
+        "rows": int(len(lengths)),
+        "percentiles": {f"p{q}": float(np.percentile(lengths, q)) for q in (50, 90, 95, 99)},
+        "max": int(lengths.max()),
+        "suggested": {f"{coverage:.0%}": suggest_max_length(lengths, coverage) for coverage in SUGGESTED_COVERAGES},
+        "over": {cap: int((lengths > cap).sum()) for cap in (64, 128)},
+    }
+
+
+def check_policy(texts, mode: str, max_length: int, batch_size: int = inference.DEFAULT_BATCH_SIZE):
+    """
+    Label agreement of `mode` at `max_length` with full-length inference,
+    overall and on the rows the policy actually changes, plus both timings.
+    """
+
+    lengths = token_lengths(texts)
+    affected = lengths > max_length
+
+    start = time.perf_counter()
+    full = inference._run_model(texts, batch_size, length_mode="full")
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    limited = inference._run_model(texts, batch_size, length_mode=mode, max_length=max_length)
+    limited_seconds = time.perf_counter() - start
+
+    agree = np.array([a[0] == b[0] for a, b in zip(full, limited)])
+    return {
+        "mode": mode,
+        "max_length": max_length,
+        "rows": len(texts),
+        "affected_rows": int(affected.sum()),
+        "agreement": float(agree.mean()) if len(agree) else float("nan"),
+        "affected_agreement": float(agree[affected].mean()) if affected.any() else float("nan"),
+        "full_seconds": full_seconds,
+        "policy_seconds": limited_seconds,
+    }
+
+
+def main():
+    from streaming_io import read_table
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    profile = commands.add_parser("profile", help="token-length distribution and suggested caps")
+    profile.add_argument("table", help="xlsx / csv / parquet with Role and Utterance columns")
+
+    check = commands.add_parser("check", help="agreement of a length mode with full-length inference")
+    check.add_argument("table", help="xlsx / csv / parquet with Role and Utterance columns")
+    check.add_argument("--mode", default="fast", choices=[m for m in inference.LENGTH_MODES if m != "full"])
+    check.add_argument("--max-length", type=int, default=inference.MAX_LENGTH)
+    check.add_argument("--batch-size", type=int, default=inference.DEFAULT_BATCH_SIZE)
+
+    args = parser.parse_args()
+
+    df = read_table(args.table, columns=["Role", "Utterance"])
+    texts = corpus_texts(df["Role"].astype(str), df["Utterance"].astype(str))
+
+    if args.command == "profile":
+        report = length_profile(token_lengths(texts))
+        print(f"Rows: {report['rows']}  max: {report['max']} tokens")
+        print("  ".join(f"{name}: {value:.0f}" for name, value in report["percentiles"].items()))
+        for coverage, length in report["suggested"].items():
+            print(f"Suggested max length for {coverage} of rows untruncated: {length}")
+        for cap, rows in report["over"].items():
+            print(f"Rows over {cap} tokens: {rows} ({rows / max(report['rows'], 1):.1%})")
+        return
+
+    report = check_policy(texts, args.mode, args.max_length, args.batch_size)
+    print(f"{report['mode']} @ {report['max_length']} tokens on {report['rows']} rows")
+    print(f"Rows longer than the cap: {report['affected_rows']}")
+    print(f"Agreement with full length: {report['agreement']:.2%} "
+          f"(on the long rows: {report['affected_agreement']:.2%})")
+    print(f"Time: full {report['full_seconds']:.2f}s, {report['mode']} {report['policy_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
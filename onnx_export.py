@@ -0,0 +1,135 @@
+"""
+Export the classifier in model/ to ONNX, optionally quantize it to INT8, and
+check how often an ONNX backend agrees with the torch backend.
+
+    python onnx_export.py export [--int8]
+    python onnx_export.py check held_out.xlsx --backend onnx-int8
+"""
+
+import argparse
+import os
+
+import inference
+
+# Column holding the human label in a held-out sheet, if any
+GOLD_COLUMNS = ("Label", "Gold_Label", "True_Label")
+
+
+# ---------------- Export ----------------
+def export_onnx(model_dir: str = None):
+    """Write model_dir/onnx/model.onnx with dynamic batch and sequence axes."""
+
+    model_dir = model_dir or inference.MODEL_DIR
+
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+
+        def forward(self, input_ids, attention_mask):
+            return self.wrapped(input_ids=input_ids, attention_mask=attention_mask).logits
+
+    sample = tokenizer(
+        ["Teacher: Open your books.", "Student: Yes ma'am"],
+        padding=True, return_tensors="pt",
+    )
+
+    path = inference.onnx_path("onnx", model_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    torch.onnx.export(
+        LogitsOnly(model),
+        (sample["input_ids"], sample["attention_mask"]),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        dynamo=False,
+    )
+    return path
+
+
+def quantize_int8(model_dir: str = None):
+    """Dynamically quantize model.onnx weights to INT8 as model.int8.onnx."""
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = inference.onnx_path("onnx", model_dir)
+    target = inference.onnx_path("onnx-int8", model_dir)
+
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    return target
+
+
+# ---------------- Agreement Check ----------------
+def check_agreement(excel_path: str, backend: str = "onnx-int8", batch_size: int = inference.DEFAULT_BATCH_SIZE,
+                    model_dir: str = None):
+    """
+    Classify a labelled sheet with the torch backend and `backend` of
+    `model_dir` (bypassing the prediction cache) and compare the two.
+
+    Returns a dict with the row count, the agreement rate between backends
+    and, when the sheet has a gold label column, each backend's accuracy.
+    """
+
+    import pandas as pd
+
+    df = pd.read_excel(excel_path)
+    texts = [f"{role}: {utt}" for role, utt in zip(df["Role"].astype(str), df["Utterance"].astype(str))]
+
+    reference = [label for label, _ in inference._run_model(texts, batch_size, backend="torch", model_dir=model_dir)]
+    candidate = [label for label, _ in inference._run_model(texts, batch_size, backend=backend, model_dir=model_dir)]
+
+    report = {
+        "rows": len(texts),
+        "backend": backend,
+        "agreement": sum(a == b for a, b in zip(reference, candidate)) / max(len(texts), 1),
+    }
+
+    gold_column = next((col for col in GOLD_COLUMNS if col in df.columns), None)
+    if gold_column is not None:
+        gold = df[gold_column].astype(str).tolist()
+        report["torch_accuracy"] = sum(a == b for a, b in zip(reference, gold)) / max(len(gold), 1)
+        report[f"{backend}_accuracy"] = sum(a == b for a, b in zip(candidate, gold)) / max(len(gold), 1)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=inference.MODEL_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write model/onnx/model.onnx")
+    export.add_argument("--int8", action="store_true", help="also write the INT8 quantized graph")
+
+    check = commands.add_parser("check", help="agreement of an ONNX backend with torch")
+    check.add_argument("excel", help="held-out sheet with Role and Utterance columns")
+    check.add_argument("--backend", default="onnx-int8", choices=list(inference.ONNX_FILES))
+    check.add_argument("--batch-size", type=int, default=inference.DEFAULT_BATCH_SIZE)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Wrote {export_onnx(args.model_dir)}")
+        if args.int8:
+            print(f"Wrote {quantize_int8(args.model_dir)}")
+    else:
+        report = check_agreement(args.excel, args.backend, args.batch_size, args.model_dir)
+        for name, value in report.items():
+            print(f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import streamlit as st
+
+from consolidation import consolidate, consolidate_stored
+from interaction_metrics import add_metrics, cbi_matrix, rank_stability
+from streaming_io import read_table
+
+# Memoization of page stages keyed on the uploaded file's content hash plus
+# the stage's parameters, so a widget change only recomputes the stage whose
+# inputs actually changed. Arguments starting with "_" are not hashed by
+# st.cache_data; the digest stands in for them.
+
+CACHE_TTL_SECONDS = 60 * 60
+CACHE_MAX_ENTRIES = 32
+
+
+# ---------------- Upload Helpers ----------------
+def upload_digest(uploaded) -> str:
+    """sha256 of an uploaded file's bytes."""
+    return hashlib.sha256(uploaded.getvalue()).hexdigest()
+
+
+def _as_file(data: bytes, name: str):
+    buffer = BytesIO(data)
+    buffer.name = name
+    return buffer
+
+
+# ---------------- Parsing Stage ----------------
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner="📄 Reading file...")
+def load_table(digest: str, _data: bytes, name: str, columns=None, sheet_name=None):
+    """Parsed table for an upload (see streaming_io.read_table)."""
+    return read_table(_as_file(_data, name), columns=columns, sheet_name=sheet_name)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner="📚 Counting labels in every sheet...")
+def consolidated_counts(digests: tuple, _files, max_workers: int):
+    """consolidation.consolidate for a set of uploads, keyed on their hashes."""
+    return consolidate(_files, max_workers=max_workers)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner="💾 Counting labels in stored datasets...")
+def stored_counts(datasets: tuple, fingerprints: tuple):
+    """consolidation.consolidate_stored, keyed on the datasets' storage fingerprints."""
+    return consolidate_stored(datasets)
+
+
+# ---------------- Metric Stages ----------------
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def metrics_frame(digest: str, policy: str, _df):
+    """add_metrics for the table parsed from upload `digest`."""
+    return add_metrics(_df, policy=policy)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cbi_sweep(digest: str, policy: str, alphas: tuple, betas: tuple, _pnr, _idir):
+    """(scores, rank stability) for one upload, zero policy and weighting set."""
+    scores = cbi_matrix(_pnr, _idir, alphas, betas)
+    return scores, rank_stability(scores)
+
+
+# ---------------- Classification Results ----------------
+class ResultStore:
+    """
+    Thread-safe, process-wide key -> value store with a TTL and a size cap.
+
+    Used for stages that report progress while they run (which st.cache_data
+    cannot replay), such as classifying a whole workbook.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if time.time() - stored_at > self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (time.time(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+@st.cache_resource
+def result_store():
+    """The ResultStore shared by every session of this server."""
+    return ResultStore()
+
+
+@st.cache_resource
+def job_scheduler():
+    """The JobScheduler (background classification jobs) shared by every session."""
+    from jobs import JobScheduler
+    return JobScheduler()
@@ -1,11 +1,31 @@
+import os
+import uuid
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-from inference import classify_text, predict_label
-from io import BytesIO
+import inference
+import perf
+from inference import classify_text, load_model, is_loaded, get_cache
+from page_cache import upload_digest, result_store, job_scheduler
+from jobs import QUEUED, RUNNING, DONE, FAILED, CANCELLED, FINISHED, classify_workbook
+from sharded import DEFAULT_WORKERS, DEFAULT_THREADS_PER_WORKER
+from streaming_io import FILE_TYPES, iter_chunks, read_header
+from storage import dataset_name
+
+# Rows read, classified and written per step (also the progress-bar granularity)
+PROGRESS_CHUNK = 1024
+
+# Seconds between progress refreshes of a queued / running job
+JOB_POLL_SECONDS = 1.0
 
 st.set_page_config(page_title="Classroom Interaction Analysis", layout="wide")
 
+# Stage timings of this script run, shown in the sidebar
+perf_run = perf.begin_run("app")
+
+# Jobs are queued fairly per browser session
+session_key = st.session_state.setdefault("job_session", uuid.uuid4().hex)
+
 # ------------------- HEADER + CUSTOM CSS -------------------
 st.markdown("""
 <style>
@@ -56,6 +76,12 @@ table {
 </style>
 """, unsafe_allow_html=True)
 
+# ------------------- MODEL (loaded lazily, once per process) -------------------
+@st.cache_resource(show_spinner="⏳ Loading classification model...")
+def get_classifier():
+    return load_model()
+
+
 st.markdown('<div class="big-title">🎓 Classroom Interaction Analysis</div>', unsafe_allow_html=True)
 st.markdown('<div class="sub-title">Classroom Interaction Classification System</div><br>', unsafe_allow_html=True)
 
@@ -74,6 +100,7 @@ with st.container():
         if text.strip() == "":
             st.warning("⚠️ Please enter some text.")
         else:
+            get_classifier()
             label, confidence = classify_text(text)
             st.success(f"**Predicted Class:** {label}")
             st.info(f"**Confidence Score:** `{confidence:.4f}`")
@@ -98,6 +125,7 @@ with st.container():
 
         if utt:
             # 🔥 Updated: Now get label + confidence
+            get_classifier()
             label, confidence = classify_text(utt)
 
             st.write(
@@ -115,14 +143,26 @@ st.markdown('<div class="section-title">📂 Excel File Classification</div>', u
 with st.container():
     st.markdown('<div class="box">', unsafe_allow_html=True)
 
-    excel_file = st.file_uploader("Upload Excel file", type=["xlsx"])
+    excel_file = st.file_uploader("Upload Excel file", type=FILE_TYPES)
+    classified = None
 
     if excel_file is not None:
-        df = pd.read_excel(excel_file)
+        digest = upload_digest(excel_file)
+        # A different file was uploaded: the previous file's job no longer applies
+        if st.session_state.get("last_upload") not in (None, digest):
+            st.session_state.pop("last_job", None)
+            st.query_params.pop("job", None)
+        st.session_state["last_upload"] = digest
+
+        # Classification results are looked up by content hash + backend
+        result_key = (digest, inference.BACKEND)
+
+        # Only the header and the first few rows are read up front
+        columns = read_header(excel_file)
 
         # ---------- Preview ----------
         st.markdown('<div class="preview-title">📄 Preview of Uploaded File</div>', unsafe_allow_html=True)
-        df_display = df.head().reset_index(drop=True)
+        df_display = next(iter_chunks(excel_file, chunk_rows=5), pd.DataFrame(columns=columns))
 
         def style_table(df_in):
             styles = [
@@ -145,66 +185,223 @@ with st.container():
         st.markdown(style_table(df_display).to_html(), unsafe_allow_html=True)
 
         # ================= VALIDATION =================
-        if "Role" not in df.columns or "Utterance" not in df.columns:
+        if "Role" not in columns or "Utterance" not in columns:
             st.error("❌ Excel must contain **Role** and **Utterance** columns!")
         else:
-            if st.button("Run Excel Predictions"):
-                st.info("🔍 Classifying all rows... Please wait.")
+            with st.expander("⚙️ Execution Settings"):
+                execution_mode = st.radio(
+                    "Execution mode",
+                    ["Single process (batched)", "Process pool (sharded)"],
+                    horizontal=True
+                )
+                colW, colT = st.columns(2)
+                workers = colW.number_input(
+                    "Worker processes", 1, os.cpu_count() or 1, DEFAULT_WORKERS, 1
+                )
+                threads_per_worker = colT.number_input(
+                    "Threads per worker", 1, os.cpu_count() or 1, DEFAULT_THREADS_PER_WORKER, 1
+                )
 
-                # Run predictions
-                df["Predicted_Label"] = df.apply(
-                    lambda row: predict_label(str(row["Role"]), str(row["Utterance"])),
-                    axis=1
+                # Defaults come from CLASSROOM_LENGTH_MODE / CLASSROOM_MAX_LENGTH; the
+                # choice here only applies to this session's runs
+                colL, colM = st.columns(2)
+                length_mode = colL.radio(
+                    "Sequence length",
+                    inference.LENGTH_MODES,
+                    index=inference.LENGTH_MODES.index(inference.LENGTH_MODE),
+                    horizontal=True,
+                    help="full: model maximum · fast: cap every row · window: average over windows of long rows"
+                )
+                max_length = colM.number_input(
+                    "Max tokens", inference.MIN_MAX_LENGTH, 512, inference.MAX_LENGTH, 16,
+                    disabled=length_mode == "full"
                 )
+                length_policy = (length_mode, int(max_length) if length_mode != "full" else None)
+                # Results differ by length policy, so it is part of the key
+                result_key = result_key + length_policy
+
+            colS, colN = st.columns(2)
+            save_to_store = colS.checkbox("💾 Also save to the columnar store (Parquet)", value=True)
+            store_name = colN.text_input("Dataset name", dataset_name(excel_file.name))
+            incremental = colS.checkbox(
+                "♻️ Incremental: only classify rows added or edited since the stored version",
+                value=True, disabled=not save_to_store
+            )
 
-                st.success("✅ Classification Completed!")
+            if st.button("Run Excel Predictions"):
+                pool_size = None
+                if execution_mode.startswith("Process pool"):
+                    pool_size = (int(workers), int(threads_per_worker))
+                else:
+                    get_classifier()
+
+                # Everything the job needs is captured here: it runs on a
+                # scheduler thread, after this script run has ended
+                job_args = (
+                    excel_file.getvalue(), excel_file.name, PROGRESS_CHUNK, pool_size,
+                    store_name if save_to_store else None, save_to_store and incremental,
+                    length_policy,
+                )
+                store, key = result_store(), result_key
+
+                def run_job(job):
+                    result = classify_workbook(job, *job_args)
+                    # Kept per upload hash + backend, so reruns and other sessions reuse it
+                    store.put(key, result)
+                    return result
+
+                try:
+                    job = job_scheduler().submit(run_job, session_key, excel_file.name, key=result_key)
+                except RuntimeError as exc:
+                    st.error(f"❌ {exc}")
+                else:
+                    # In the URL, so a refresh or another tab finds the job again
+                    st.query_params["job"] = job.id
+                    st.session_state["last_job"] = job.id
+
+            # Results of an earlier run on this upload, from any session
+            classified = result_store().get(result_key)
 
+    st.markdown('</div>', unsafe_allow_html=True)
 
-                # =========================================================
-                # 🔥 NEW SECTION — DATA VISUALIZATION
-                # =========================================================
-                st.markdown('<div class="section-title">📊 Data Visualization</div>', unsafe_allow_html=True)
-                st.markdown('<div class="box">', unsafe_allow_html=True)
 
-                # ---- Total Utterances ----
-                total_utter = len(df)
-                teacher_utter = len(df[df["Role"].str.lower() == "teacher"])
-                student_utter = len(df[df["Role"].str.lower() == "student"])
+# ====================================================
+# 🔷 SECTION 4 — Background Job
+# ====================================================
+job_id = st.query_params.get("job") or st.session_state.get("last_job")
+job = job_scheduler().get(job_id) if job_id else None
+
+if job_id and job is None:
+    st.info("⌛ That classification job is no longer available (finished over an hour ago or the server restarted).")
+
+
+def show_job(job):
+    """Status, progress, ETA, partial counts and a cancel button for `job`."""
+
+    snapshot = job.snapshot()
+    status, done, total = snapshot["status"], snapshot["done"], snapshot["total"]
+
+    st.markdown(f'<div class="section-title">⚙️ Job `{job.id}` — {job.name}</div>', unsafe_allow_html=True)
+
+    if status == QUEUED:
+        ahead = job_scheduler().position(job.id)
+        st.info(f"🕒 Queued — {ahead} job(s) ahead of this one")
+    elif status == RUNNING:
+        eta = job.eta_seconds()
+        text = f"🔍 Classified {done} / {total} rows" if total else f"🔍 Classified {done} rows"
+        if eta is not None:
+            text += f" · about {eta:.0f}s left"
+        st.progress(min(done / total, 1.0) if total else 0.0, text=text)
+
+        if snapshot["partial_counts"]:
+            st.caption("So far: " + " · ".join(
+                f"{label} {count}" for label, count in sorted(snapshot["partial_counts"].items())
+            ))
+        if snapshot["preview"] is not None:
+            st.dataframe(snapshot["preview"], use_container_width=True, hide_index=True)
+    elif status == DONE:
+        st.success(f"✅ Classification Completed in {job.finished - job.started:.1f}s!")
+        for note in job.result["notes"]:
+            st.caption(note)
+    elif status == FAILED:
+        st.error(f"❌ Classification failed: {job.error}")
+    elif status == CANCELLED:
+        st.warning(f"⏹ Cancelled after {done} rows")
+
+    if status in FINISHED and job.perf_run is not None:
+        # The job's spans were recorded on its worker thread, not in this page's run
+        with st.expander("⏱ Job performance"):
+            perf.show_run(job.perf_run)
+            if any(stage.startswith("workers/") for stage in job.perf_run.stages):
+                st.caption("workers/ stages add up the time of every worker process, so they can exceed the wall-clock time.")
+
+    if status not in FINISHED:
+        if job.cancelling:
+            st.caption("⏹ Cancelling after the current chunk...")
+        elif st.button("⏹ Cancel job", key=f"cancel_{job.id}"):
+            job_scheduler().cancel(job.id)
+            st.rerun()
+
+
+if job is not None:
+    if job.status in FINISHED:
+        show_job(job)
+    else:
+        # Only this fragment reruns while the job is in flight; the whole
+        # page reruns once when it finishes, to show the results
+        @st.fragment(run_every=JOB_POLL_SECONDS)
+        def poll_job():
+            show_job(job)
+            if job.status in FINISHED:
+                st.rerun()
+
+        poll_job()
+
+    # Only show the job's result under the upload it classified (or with no upload at all)
+    if job.status == DONE and classified is None and (excel_file is None or job.key == result_key):
+        classified = job.result
+
+        cache = get_cache()
+        if cache is not None:
+            stats = cache.stats()
+            st.caption(
+                f"♻️ Prediction cache: {stats['hits']} hits · {stats['misses']} misses · "
+                f"{stats['entries']} stored"
+            )
 
-                colA, colB, colC = st.columns(3)
-                colA.metric("🗂 Total Utterances", total_utter)
-                colB.metric("👩‍🏫 Teacher Utterances", teacher_utter)
-                colC.metric("👧 Student Utterances", student_utter)
+if classified is not None:
+    totals = classified["totals"]
+    label_counts = classified["label_counts"]
 
-                # ---- Predicted Label Counts ----
-                label_counts = df["Predicted_Label"].value_counts()
+    # =========================================================
+    # 🔥 NEW SECTION — DATA VISUALIZATION
+    # =========================================================
+    st.markdown('<div class="section-title">📊 Data Visualization</div>', unsafe_allow_html=True)
+    st.markdown('<div class="box">', unsafe_allow_html=True)
 
-                st.subheader("📌 Predicted Label Distribution")
+    # ---- Total Utterances ----
+    total_utter = totals["rows"]
+    teacher_utter = totals["teacher"]
+    student_utter = totals["student"]
 
-                # Bar Chart
-                fig, ax = plt.subplots(figsize=(6, 4))  # 🔥 Change size here
-                ax.bar(label_counts.index, label_counts.values)
-                ax.set_xlabel("Labels")
-                ax.set_ylabel("Count")
-                ax.set_title("Predicted Class Distribution")
+    colA, colB, colC = st.columns(3)
+    colA.metric("🗂 Total Utterances", total_utter)
+    colB.metric("👩‍🏫 Teacher Utterances", teacher_utter)
+    colC.metric("👧 Student Utterances", student_utter)
 
-                st.pyplot(fig)  
+    # ---- Predicted Label Counts ----
+    st.subheader("📌 Predicted Label Distribution")
 
-                st.markdown('</div>', unsafe_allow_html=True)
+    # Bar Chart
+    with perf.span("chart"):
+        fig, ax = plt.subplots(figsize=(6, 4))  # 🔥 Change size here
+        ax.bar(label_counts.index, label_counts.values)
+        ax.set_xlabel("Labels")
+        ax.set_ylabel("Count")
+        ax.set_title("Predicted Class Distribution")
 
-                # =========================================================
-                # 🔥 DOWNLOAD PREDICTED FILE
-                # =========================================================
-                buffer = BytesIO()
-                df.to_excel(buffer, index=False, engine="openpyxl")
-                buffer.seek(0)
+        st.pyplot(fig)
 
-                st.download_button(
-                    label="📥 Download Classified Excel",
-                    data=buffer,
-                    file_name="classified_output.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+    st.markdown('</div>', unsafe_allow_html=True)
 
+    # =========================================================
+    # 🔥 DOWNLOAD PREDICTED FILE
+    # =========================================================
+    st.download_button(
+        label="📥 Download Classified Excel",
+        data=classified["xlsx"],
+        file_name="classified_output.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
 
-    st.markdown('</div>', unsafe_allow_html=True)
+
+# ------------------- JOB QUEUE -------------------
+queue = job_scheduler().stats()
+st.sidebar.caption(f"🧵 Jobs: {queue['running']} / {queue['max_running']} running · {queue['queued']} queued")
+
+# ------------------- MODEL STATUS -------------------
+if is_loaded():
+    bundle = get_classifier()
+    st.sidebar.caption(f"🧠 Model ({bundle['backend']}) loaded in {bundle['load_seconds']:.1f}s")
+
+perf.sidebar_panel(perf_run)
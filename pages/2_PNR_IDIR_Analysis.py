@@ -1,11 +1,22 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
+import perf
+import plotting
+from streaming_io import FILE_TYPES
+from interaction_metrics import ZERO_POLICIES, UNDEFINED_QUADRANT, cbi, alpha_grid
+from storage import AGGREGATES, fingerprint, list_datasets, load_aggregates
+from page_cache import CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, upload_digest, load_table, metrics_frame, cbi_sweep
+
+# Most CBI experiments drawn in the comparison chart
+MAX_PLOTTED_EXPERIMENTS = 10
 
 # ------------------- PAGE CONFIG -------------------
 st.set_page_config(page_title="PNR–IDIR Analysis", layout="wide")
 
+# Stage timings of this script run, shown in the sidebar
+perf_run = perf.begin_run("pnr_idir")
+
 # ------------------- CUSTOM CSS FOR TABLES -------------------
 st.markdown("""
 <style>
@@ -108,11 +119,30 @@ table thead tr th:first-child {
 # ------------------- PAGE TITLE -------------------
 st.markdown('<div class="section-title">📊 PNR–IDIR Classroom Interaction Analysis</div>', unsafe_allow_html=True)
 
-uploaded = st.file_uploader("📥 Upload your Speaker Excel File", type=["xlsx"])
+source = st.radio("Source", ["Upload file", "Columnar store"], horizontal=True)
+
+df = None
+
+if source == "Columnar store":
+    stored = list_datasets(AGGREGATES)
+    if stored:
+        table_name = st.selectbox("💾 Stored aggregate table", stored)
+        # Memory-mapped Parquet read; the fingerprint keys the metric stages
+        digest = fingerprint(table_name, AGGREGATES)
+        with perf.span("parse_parquet"):
+            df = load_aggregates(table_name)
+    else:
+        st.info("💾 No stored aggregate tables yet — save one from the Consolidated or Pipeline page.")
+else:
+    uploaded = st.file_uploader("📥 Upload your Speaker Excel File", type=FILE_TYPES)
+
+    if uploaded is not None:
+        # Parsing is cached on the file's content hash; reruns skip it
+        digest = upload_digest(uploaded)
+        df = load_table(digest, uploaded.getvalue(), uploaded.name)
 
-if uploaded is not None:
+if df is not None:
 
-    df = pd.read_excel(uploaded)
     df.index = df.index + 1
 
     # ASSUME SPEAKER COLUMN EXISTS OR CREATE IT IF NOT
@@ -130,8 +160,24 @@ if uploaded is not None:
     """)
 
     # ------------------- COMPUTE -------------------
-    df["pnr"] = df["Response"] / df["Instruction"]
-    df["idir"] = (df["Response"] + df["Question"]) / (df["Lecture"] + df["Instruction"])
+    zero_policy = st.selectbox(
+        "➗ When a denominator is zero",
+        ZERO_POLICIES,
+        format_func={
+            "nan": "Leave undefined (exclude from ranges, plots and quadrants)",
+            "zero": "Treat the ratio as 0",
+            "cap": "Cap at the largest observed ratio (0 / 0 = 0)",
+        }.get
+    )
+
+    # PNR, IDIR, CBI and quadrants for every class in one vectorized pass,
+    # recomputed only when the file or the zero policy changes
+    with perf.span("metrics"):
+        df = metrics_frame(digest, zero_policy, df)
+
+    undefined = int((df["Quadrant"] == UNDEFINED_QUADRANT).sum())
+    if undefined:
+        st.caption(f"⚠️ {undefined} class(es) have a zero denominator and are left undefined.")
 
     # ------------------- RANGE SUMMARY -------------------
     max_pnr = df["pnr"].max()
@@ -153,19 +199,6 @@ if uploaded is not None:
     st.dataframe(df_display, use_container_width=True)
 
 
-    # ------------------- QUADRANT LOGIC -------------------
-    def assign_quadrant(row):
-        if row["pnr"] >= 1 and row["idir"] >= 1:
-            return "Q1"
-        elif row["pnr"] < 1 and row["idir"] >= 1:
-            return "Q2"
-        elif row["pnr"] < 1 and row["idir"] < 1:
-            return "Q3"
-        else:
-            return "Q4"
-
-    df["Quadrant"] = df.apply(assign_quadrant, axis=1)
-
     # ------------------- QUADRANT DESCRIPTIONS -------------------
     st.markdown("""
     ### 🧭 Quadrant Interpretation Guide
@@ -188,50 +221,47 @@ if uploaded is not None:
         "Q1": "red",
         "Q2": "lightskyblue",
         "Q3": "blue",
-        "Q4": "pink"
+        "Q4": "pink",
+        UNDEFINED_QUADRANT: "lightgray"
     }
 
-    # ------------------- FIGURE 1 -------------------
-    # ------------------- FIGURE 1 -------------------
-    st.markdown('<div class="sub-heading">📈 Graph 1 — Full IDIR–PNR Plot</div>', unsafe_allow_html=True)
+    # Large files: WebGL, per-quadrant downsampling and labels only on
+    # extreme points plus the classes picked here
+    selected = ()
+    if len(df) > plotting.LABEL_ALL_POINTS:
+        selected = tuple(st.multiselect("🏷 Label classes in the graphs", df["Speakers"].tolist()))
 
-    fig1 = px.scatter(
-        df, x="idir", y="pnr",
-        color="Quadrant",
-        text="Speakers",
-        color_discrete_map=quadrant_colors,
-        hover_data=["Speakers", "pnr", "idir", "Quadrant"]
-    )
+    # ------------------- CACHED QUADRANT FIGURES -------------------
+    # Rebuilt only when the file, the zero policy or the labelled classes
+    # change, not on every rerun
+    @st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+    def quadrant_figure(digest, policy, q1_only, selected, _df):
+        data = _df[(_df["pnr"] >= 1) & (_df["idir"] >= 1)] if q1_only else _df
 
-    fig1.update_traces(textposition="top center")
-    fig1.add_hline(y=1, line_dash="dash", line_width=1)
-    fig1.add_vline(x=1, line_dash="dash", line_width=1)
-    fig1.update_xaxes(title="IDIR")
-    fig1.update_yaxes(title="PNR")
+        return plotting.quadrant_scatter(
+            data, ["Speakers", "pnr", "idir", "Quadrant"], selected, quadrant_colors
+        )
 
-    st.plotly_chart(fig1, use_container_width=True)
+    def show_quadrant_figure(q1_only):
+        with perf.span("plotly"):
+            fig, drawn = quadrant_figure(digest, zero_policy, q1_only, selected, df)
+            total = int(((df["pnr"] >= 1) & (df["idir"] >= 1)).sum()) if q1_only else len(df)
+            if drawn < total:
+                st.caption(f"🔎 {drawn:,} of {total:,} classes drawn (binned per quadrant; hover shows Points per marker)")
+
+            st.plotly_chart(fig, use_container_width=True)
+
+    # ------------------- FIGURE 1 -------------------
+    st.markdown('<div class="sub-heading">📈 Graph 1 — Full IDIR–PNR Plot</div>', unsafe_allow_html=True)
+
+    show_quadrant_figure(False)
 
-    # ------------------- FIGURE 2 (Q1 ONLY) -------------------
     # ------------------- FIGURE 2 (Q1 ONLY) -------------------
     st.markdown('<div class="sub-heading">📈 Graph 2 — Only Q1 Region (IDIR–PNR)</div>', unsafe_allow_html=True)
 
     df_q1 = df[(df["pnr"] >= 1) & (df["idir"] >= 1)]
 
-    fig2 = px.scatter(
-        df_q1, x="idir", y="pnr",
-        color="Quadrant",
-        text="Speakers",
-        color_discrete_map=quadrant_colors,
-        hover_data=["Speakers", "pnr", "idir", "Quadrant"]
-    )
-
-    fig2.update_traces(textposition="top center")
-    fig2.add_hline(y=1, line_dash="dash", line_width=1)
-    fig2.add_vline(x=1, line_dash="dash", line_width=1)
-    fig2.update_xaxes(title="IDIR")
-    fig2.update_yaxes(title="PNR")
-
-    st.plotly_chart(fig2, use_container_width=True)
+    show_quadrant_figure(True)
 
 
     # ------------------- CLASSROOM BALANCE INDEX (CBI) -------------------
@@ -246,7 +276,7 @@ if uploaded is not None:
     """)
 
     df_cbi = df_q1.copy()
-    df_cbi["CBI"] = (0.45 * df_cbi["pnr"]) + (0.55 * df_cbi["idir"])
+    df_cbi["CBI"] = cbi(df_cbi["pnr"], df_cbi["idir"], 0.45, 0.55)
     df_cbi_sorted = df_cbi.sort_values(by="CBI", ascending=False)
 
     st.markdown("### 🧮 Classroom Balance Index Table (Q1 Only)")
@@ -255,54 +285,64 @@ if uploaded is not None:
 
 
     # ---------------------------------------------------------
-    # 📌 ADVANCED CBI ANALYSIS — 4 Experiments with Dynamic α & β
+    # 📌 ADVANCED CBI ANALYSIS — Any Number of α & β Experiments
     # ---------------------------------------------------------
     st.markdown('<div class="sub-heading">🧮 Advanced CBI Experiments</div>', unsafe_allow_html=True)
 
     st.markdown("""
     ### 📘 CBI Formula  
     CBI = α × PNR + β × IDIR  
-    Enter **α and β for 4 experiments** (α + β = 1).
+    Enter **α and β for as many experiments as you like** (α + β = 1), or sweep a full α grid.
     """)
 
-    with st.expander("⚙️ Enter Alpha (α) and Beta (β) for 4 Experiments"):
-        colA1, colB1 = st.columns(2)
-        alpha1 = colA1.number_input("α₁", 0.0, 1.0, 0.45, 0.01)
-        beta1 = colB1.number_input("β₁", 0.0, 1.0, 0.55, 0.01)
-
-        colA2, colB2 = st.columns(2)
-        alpha2 = colA2.number_input("α₂", 0.0, 1.0, 0.40, 0.01)
-        beta2 = colB2.number_input("β₂", 0.0, 1.0, 0.60, 0.01)
-
-        colA3, colB3 = st.columns(2)
-        alpha3 = colA3.number_input("α₃", 0.0, 1.0, 0.35, 0.01)
-        beta3 = colB3.number_input("β₃", 0.0, 1.0, 0.65, 0.01)
-
-        colA4, colB4 = st.columns(2)
-        alpha4 = colA4.number_input("α₄", 0.0, 1.0, 0.30, 0.01)
-        beta4 = colB4.number_input("β₄", 0.0, 1.0, 0.70, 0.01)
-
-    df_exp = df.copy()
-    df_exp["EXP1"] = alpha1 * df_exp["pnr"] + beta1 * df_exp["idir"]
-    df_exp["EXP2"] = alpha2 * df_exp["pnr"] + beta2 * df_exp["idir"]
-    df_exp["EXP3"] = alpha3 * df_exp["pnr"] + beta3 * df_exp["idir"]
-    df_exp["EXP4"] = alpha4 * df_exp["pnr"] + beta4 * df_exp["idir"]
+    with st.expander("⚙️ Enter Alpha (α) and Beta (β) for the Experiments"):
+        sweep_mode = st.radio("Weightings", ["Custom pairs", "α grid (β = 1 − α)"], horizontal=True)
+
+        if sweep_mode == "Custom pairs":
+            weights = st.data_editor(
+                pd.DataFrame({"α": [0.45, 0.40, 0.35, 0.30], "β": [0.55, 0.60, 0.65, 0.70]}),
+                num_rows="dynamic",
+                use_container_width=True
+            ).dropna()
+            alphas = weights["α"].to_numpy(dtype=float)
+            betas = weights["β"].to_numpy(dtype=float)
+        else:
+            colS, colE, colP = st.columns(3)
+            alpha_start = colS.number_input("α from", 0.0, 1.0, 0.0, 0.01)
+            alpha_stop = colE.number_input("α to", 0.0, 1.0, 1.0, 0.01)
+            alpha_step = colP.number_input("Step", 0.001, 1.0, 0.01, 0.001, format="%.3f")
+            alphas, betas = alpha_grid(alpha_start, alpha_stop, alpha_step)
+
+    if len(alphas) == 0:
+        st.warning("⚠️ Add at least one α / β pair.")
+        st.stop()
+
+    # Every experiment for every class in one matrix product (cached per weighting set)
+    exp_columns = [f"EXP{i + 1}" for i in range(len(alphas))]
+    with perf.span("cbi_sweep"):
+        scores, stability = cbi_sweep(
+            digest, zero_policy, tuple(map(float, alphas)), tuple(map(float, betas)),
+            df["pnr"].to_numpy(), df["idir"].to_numpy()
+        )
+
+    df_exp = pd.concat(
+        [df[["Speakers", "pnr", "idir"]], pd.DataFrame(scores, columns=exp_columns, index=df.index)],
+        axis=1
+    )
 
     st.markdown("### 📊 Experiment Results Table")
-    st.dataframe(
-        df_exp[["Speakers", "pnr", "idir", "EXP1", "EXP2", "EXP3", "EXP4"]],
-        use_container_width=True
-    )
+    st.caption(", ".join(f"{col}: α={a:g}, β={b:g}" for col, a, b in zip(exp_columns[:12], alphas, betas))
+               + (" …" if len(exp_columns) > 12 else ""))
+    st.dataframe(df_exp, use_container_width=True)
 
-    st.markdown('<div class="sub-heading">📈 Comparison of 4 CBI Experiments</div>', unsafe_allow_html=True)
-    fig = px.line(
-        df_exp,
-        x="Speakers",
-        y=["EXP1", "EXP2", "EXP3", "EXP4"],
-        markers=True,
-        title="CBI Experiment Comparison"
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    st.markdown(f'<div class="sub-heading">📈 Comparison of {len(exp_columns)} CBI Experiments</div>', unsafe_allow_html=True)
+
+    # A few evenly spaced experiments keep the chart readable for large sweeps
+    plotted = [exp_columns[i] for i in np.unique(np.linspace(0, len(exp_columns) - 1, MAX_PLOTTED_EXPERIMENTS).round().astype(int))]
+    with perf.span("plotly"):
+        # Min / max per bucket of classes keeps every line's shape for large files
+        fig = plotting.line_chart(df_exp, "Speakers", plotted, title="CBI Experiment Comparison")
+        st.plotly_chart(fig, use_container_width=True)
 
 
     # ---------------------------------------------------------
@@ -310,9 +350,15 @@ if uploaded is not None:
     # ---------------------------------------------------------
     st.markdown("### 🏆 Ranked Classroom Balance Index")
 
-    # Calculate combined ranking score (mean of 4 experiments)
+    # Combined ranking score (mean over all experiments) plus how stable
+    # each class's rank is across the sweep
     df_rank = df_exp.copy()
-    df_rank["Ranked Classroom Balance Index"] = df_rank[["EXP1", "EXP2", "EXP3", "EXP4"]].mean(axis=1)
+    df_rank["Ranked Classroom Balance Index"] = np.nanmean(scores, axis=1) if scores.size else np.nan
+    df_rank["Mean Rank"] = stability["mean_rank"]
+    df_rank["Rank Std"] = stability["rank_std"]
+    df_rank["Best Rank"] = stability["best_rank"]
+    df_rank["Worst Rank"] = stability["worst_rank"]
+    df_rank["Top-10 Share"] = stability["top_k_share"]
 
     # Sort in descending order
     df_rank_sorted = df_rank.sort_values(by="Ranked Classroom Balance Index", ascending=False)
@@ -320,13 +366,17 @@ if uploaded is not None:
     # Rename pnr and idir for display (optional)
     df_rank_display = df_rank_sorted.rename(columns={"pnr": "PNR", "idir": "IDIR"})
 
-    # Display final ranked table
+    # Display final ranked table (every EXP column only for small sweeps)
+    shown_exp = exp_columns if len(exp_columns) <= MAX_PLOTTED_EXPERIMENTS else []
     st.dataframe(
         df_rank_display[
-            ["Speakers", "PNR", "IDIR", "EXP1", "EXP2", "EXP3", "EXP4", "Ranked Classroom Balance Index"]
+            ["Speakers", "PNR", "IDIR"] + shown_exp
+            + ["Ranked Classroom Balance Index", "Mean Rank", "Rank Std", "Best Rank", "Worst Rank", "Top-10 Share"]
         ],
         use_container_width=True
     )
 
-else:
+elif source == "Upload file":
     st.info("📥 Please upload an Excel file to begin.")
+
+perf.sidebar_panel(perf_run)
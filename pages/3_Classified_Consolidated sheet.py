@@ -1,9 +1,16 @@
+import os
 import streamlit as st
 import pandas as pd
-from io import BytesIO
+import perf
+from streaming_io import FILE_TYPES, write_xlsx
+from page_cache import upload_digest, consolidated_counts, stored_counts
+from storage import AGGREGATES, fingerprint, list_datasets, save_aggregates
 
 st.set_page_config(page_title="Consolidated Class Analysis", layout="wide")
 
+# Stage timings of this script run, shown in the sidebar
+perf_run = perf.begin_run("consolidated")
+
 st.markdown("""
 <div style="font-size:40px; font-weight:700; text-align:center; color:#2A4D69;">
 📚 Consolidated Classroom Analysis
@@ -11,67 +18,76 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 st.write("")
-st.write("### Upload Multiple Excel Files (Each May Contain Multiple Sheets)")
-st.write("Each Sheet = One Class")
-
-uploaded_files = st.file_uploader(
-    "Upload Excel Files",
-    type=["xlsx"],
-    accept_multiple_files=True
-)
-
-if uploaded_files:
-    st.success(f"📄 {len(uploaded_files)} files uploaded")
-
-    consolidated_data = []
-    class_counter = 1   # Global class counter across all files
-
-    for file in uploaded_files:
-        # Load all sheets from this Excel file
-        xls = pd.ExcelFile(file)
-
-        st.markdown(f"### 📘 File: **{file.name}**")
-        st.write(f"Contains {len(xls.sheet_names)} sheet(s).")
-
-        for sheet_name in xls.sheet_names:
-
-            df = pd.read_excel(xls, sheet_name=sheet_name)
-
-            if not {"Role", "Utterances", "Predicted_Label"}.issubset(df.columns):
-                st.error(f"❌ Sheet '{sheet_name}' does not contain required columns!")
-                continue
-
-            # Count each category
-            lecture = (df["Predicted_Label"] == "LECT").sum()
-            instruction = (df["Predicted_Label"] == "INST").sum()
-            question = (df["Predicted_Label"] == "QUES").sum()
-            response = (df["Predicted_Label"] == "RESP").sum()
-
-            total = lecture + instruction + question + response
-
-            consolidated_data.append({
-                "Speakers": f"Class {class_counter}",
-                "Lecture": lecture,
-                "Instruction": instruction,
-                "Question": question,
-                "Response": response,
-                "Total": total
-            })
-
-            class_counter += 1  # Move to next class number
+source = st.radio("Source", ["Upload Excel files", "Columnar store"], horizontal=True)
+
+consolidated_df = None
+
+if source == "Columnar store":
+    st.write("### Pick Stored Classified Datasets")
+    st.write("Each stored class partition (or each dataset without classes) = One Class")
+
+    datasets = st.multiselect("Classified datasets", list_datasets())
+    if datasets:
+        # Only the class partition and Predicted_Label columns are read, memory-mapped
+        with perf.span("consolidate"):
+            consolidated_df = stored_counts(tuple(datasets), tuple(fingerprint(name) for name in datasets))
+    else:
+        st.info("💾 No dataset selected — classify a file on the app page to store one.")
+
+else:
+    st.write("### Upload Multiple Excel Files (Each May Contain Multiple Sheets)")
+    st.write("Each Sheet = One Class")
+
+    uploaded_files = st.file_uploader(
+        "Upload Excel Files",
+        type=FILE_TYPES,
+        accept_multiple_files=True
+    )
 
+    if uploaded_files:
+        st.success(f"📄 {len(uploaded_files)} files uploaded")
+
+        max_workers = st.sidebar.number_input(
+            "⚙️ Parallel sheet workers", 1, os.cpu_count() or 1, os.cpu_count() or 1, 1
+        )
+
+        # Every sheet of every file is counted in a worker pool; classes are
+        # numbered in file order, then sheet order
+        with perf.span("consolidate"):
+            consolidated_df, reports = consolidated_counts(
+                tuple(upload_digest(file) for file in uploaded_files),
+                [(file.name, file.getvalue()) for file in uploaded_files],
+                int(max_workers)
+            )
+
+        for report in reports:
+            st.markdown(f"### 📘 File: **{report['name']}**")
+            # Summed over sheets that are parsed in parallel: worker time, not time waited
+            st.write(
+                f"Contains {len(report['sheets'])} sheet(s) · "
+                f"{report['seconds']:.2f}s of worker time parsing them"
+            )
+
+            for sheet_name, counts, _ in report["sheets"]:
+                if counts is None:
+                    st.error(f"❌ Sheet '{sheet_name}' does not contain required columns!")
+
+if consolidated_df is not None:
     # ===========================
     # Final Consolidated DataFrame
     # ===========================
-    consolidated_df = pd.DataFrame(consolidated_data)
-
     st.write("## 📊 Final Consolidated Analysis Sheet")
     st.dataframe(consolidated_df, use_container_width=True)
 
+    # ============= SAVE TO STORE ==============
+    colN, colB = st.columns([3, 1])
+    aggregate_name = colN.text_input("Save as aggregate table", "consolidated_class_analysis")
+    if colB.button("💾 Save to store"):
+        save_aggregates(consolidated_df, aggregate_name)
+        st.success(f"💾 Saved — available on the PNR–IDIR page ({len(list_datasets(AGGREGATES))} stored tables)")
+
     # ============= DOWNLOAD BUTTON ==============
-    buffer = BytesIO()
-    consolidated_df.to_excel(buffer, index=False, engine="openpyxl")
-    buffer.seek(0)
+    buffer = write_xlsx([consolidated_df])
 
     st.download_button(
         label="📥 Download Consolidated Sheet",
@@ -79,3 +95,5 @@ if uploaded_files:
         file_name="consolidated_class_analysis.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
+
+perf.sidebar_panel(perf_run)
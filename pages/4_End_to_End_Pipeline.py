@@ -0,0 +1,124 @@
+import streamlit as st
+import pandas as pd
+import perf
+import plotting
+import inference
+from pipeline import transcripts_from_files, classify_transcripts, aggregate_counts, to_excel
+from interaction_metrics import ZERO_POLICIES, UNDEFINED_QUADRANT, add_metrics
+from streaming_io import FILE_TYPES
+from page_cache import upload_digest, result_store
+from storage import AGGREGATES, list_datasets, load_classified, save_aggregates, save_classified
+
+st.set_page_config(page_title="End-to-End Pipeline", layout="wide")
+
+# Stage timings of this script run, shown in the sidebar
+perf_run = perf.begin_run("pipeline")
+
+st.markdown("""
+<div style="font-size:40px; font-weight:700; text-align:center; color:#2A4D69;">
+🚀 Transcript → Quadrant Pipeline
+</div>
+""", unsafe_allow_html=True)
+
+st.write("")
+source = st.radio("Source", ["Upload transcripts", "Columnar store"], horizontal=True)
+
+classified = None
+
+if source == "Columnar store":
+    stored = list_datasets()
+    if stored:
+        dataset = st.selectbox("💾 Stored classified dataset", stored)
+        # Memory-mapped Parquet read of a dataset saved by this page or the app page
+        classified = load_classified(dataset)
+        if "Class" not in classified.columns:
+            classified.insert(0, "Class", pd.Categorical([dataset] * len(classified)))
+    else:
+        st.info("💾 No stored datasets yet — run the pipeline on uploads and save it.")
+
+else:
+    st.write("### Upload Raw Transcripts (Role + Utterance, Each Sheet = One Class)")
+    st.write("Classification, label counts, PNR / IDIR / CBI and quadrants run in one go — no Excel downloads in between.")
+
+    uploaded_files = st.file_uploader(
+        "Upload Transcript Files",
+        type=FILE_TYPES,
+        accept_multiple_files=True
+    )
+
+    if uploaded_files:
+        # Classification is the expensive stage; it is kept per set of uploads + backend
+        result_key = ("pipeline", tuple(upload_digest(file) for file in uploaded_files), inference.BACKEND)
+
+        if st.button("Run Pipeline"):
+            transcripts, skipped = transcripts_from_files(uploaded_files)
+
+            for file_name, sheet_name in skipped:
+                st.error(f"❌ {file_name} / sheet '{sheet_name}' has no Role and Utterance columns — skipped.")
+
+            progress_bar = st.progress(0.0, text="🔍 Classifying all classes...")
+            classified = classify_transcripts(
+                transcripts,
+                progress=lambda done, total: progress_bar.progress(
+                    done / max(total, 1), text=f"🔍 Classified {done} / {total} utterances"
+                )
+            )
+            result_store().put(result_key, classified)
+            st.success(f"✅ Classified {len(classified)} utterances across {len(transcripts)} classes")
+
+        classified = result_store().get(result_key)
+
+    else:
+        st.info("📥 Please upload one or more transcript files to begin.")
+
+if classified is not None:
+    # Aggregation and metrics are cheap and run in memory on every rerun
+    zero_policy = st.selectbox("➗ When a denominator is zero", ZERO_POLICIES)
+    with perf.span("aggregate"):
+        consolidated = aggregate_counts(classified)
+        metrics = add_metrics(consolidated, policy=zero_policy)
+
+    colA, colB, colC = st.columns(3)
+    colA.metric("🏫 Classes", len(consolidated))
+    colB.metric("🗂 Utterances", len(classified))
+    colC.metric("🟥 Q1 Classes", int((metrics["Quadrant"] == "Q1").sum()))
+
+    st.write("## 📊 Consolidated Counts and Metrics")
+    st.dataframe(metrics.rename(columns={"pnr": "PNR", "idir": "IDIR"}), use_container_width=True)
+
+    st.write("## 📈 IDIR–PNR Quadrants")
+    with perf.span("plotly"):
+        fig, drawn = plotting.quadrant_scatter(
+            metrics, ["Speakers", "pnr", "idir", "CBI", "Quadrant"],
+            colors={**plotting.QUADRANT_COLORS, UNDEFINED_QUADRANT: "lightgray"}
+        )
+        if drawn < len(metrics):
+            st.caption(f"🔎 {drawn:,} of {len(metrics):,} classes drawn (binned per quadrant)")
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.write("## 🏆 Ranked Classroom Balance Index")
+    st.dataframe(
+        metrics.sort_values(by="CBI", ascending=False)[["Speakers", "pnr", "idir", "CBI", "Quadrant"]]
+        .rename(columns={"pnr": "PNR", "idir": "IDIR"}),
+        use_container_width=True
+    )
+
+    # ============= SAVE TO STORE ==============
+    colN, colB = st.columns([3, 1])
+    store_name = colN.text_input("Save as dataset", "pipeline_results")
+    if colB.button("💾 Save to store"):
+        # Utterances partitioned by class; counts + metrics as an aggregate table
+        save_classified(classified, store_name)
+        save_aggregates(metrics, store_name)
+        st.success(f"💾 Saved {len(classified)} utterances and {len(metrics)} class rows ({len(list_datasets(AGGREGATES))} stored tables)")
+
+    # ============= OPTIONAL SINGLE EXCEL EXPORT ==============
+    if st.checkbox("📦 Prepare Excel export (classified utterances, counts and metrics)"):
+        st.download_button(
+            label="📥 Download Pipeline Results",
+            data=to_excel({"classified": classified, "consolidated": consolidated, "metrics": metrics}),
+            file_name="pipeline_results.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+perf.sidebar_panel(perf_run)
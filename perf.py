@@ -0,0 +1,227 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Lightweight timing spans and counters for the hot path (parsing,
+# tokenization, forward pass, decoding, Excel encoding, chart rendering).
+#
+# Every span is added to process-wide totals (rendered in Prometheus text
+# format) and to the current Run, if one is active in this thread. A page
+# starts a Run at the top of its script and shows it in the sidebar; with
+# CLASSROOM_PERF_LOG set, every finished run is also appended to that file
+# as one JSON line.
+
+PERF_LOG = os.environ.get("CLASSROOM_PERF_LOG")
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+# ---------------- Prometheus Histogram ----------------
+class Histogram:
+    """Cumulative-bucket histogram rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = {}  # label value -> per-bucket counts (+Inf last)
+        self.sums = {}
+
+    def observe(self, value: float, label: str = ""):
+        counts = self.counts.setdefault(label, [0] * (len(self.buckets) + 1))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-1] += 1
+        self.sums[label] = self.sums.get(label, 0.0) + value
+
+    def render(self, label_name: str = "endpoint"):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label, counts in sorted(self.counts.items()):
+            tag = f'{label_name}="{label}",' if label else ""
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{tag}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{tag}le="+Inf"}} {counts[-1]}')
+            suffix = f"{{{tag.rstrip(',')}}}" if tag else ""
+            lines.append(f"{self.name}_sum{suffix} {self.sums[label]:.6f}")
+            lines.append(f"{self.name}_count{suffix} {counts[-1]}")
+        return lines
+
+
+_lock = threading.Lock()
+_stage_seconds = Histogram("classroom_stage_seconds", "Time spent per hot-path stage.", STAGE_BUCKETS)
+_batch_sizes = Histogram("classroom_forward_batch_size", "Utterances per forward pass.", BATCH_SIZE_BUCKETS)
+_counters = {}
+
+
+# ---------------- Runs ----------------
+class Run:
+    """Spans and counters recorded during one page run (or any unit of work)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self.stages = {}  # stage -> [calls, seconds]
+        self.counters = {}
+
+    def add_span(self, stage: str, seconds: float):
+        entry = self.stages.setdefault(stage, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def add_count(self, counter: str, value: float):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def merge(self, other, prefix: str = ""):
+        """Add the spans (stage names prefixed with `prefix`) and counters of `other`, e.g. a worker's run."""
+
+        for stage, (calls, seconds) in other.stages.items():
+            entry = self.stages.setdefault(prefix + stage, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+        for counter, value in other.counters.items():
+            self.add_count(counter, value)
+
+    def records(self):
+        """One dict per stage, in the order stages first ran."""
+        return [
+            {"stage": stage, "calls": calls, "seconds": seconds}
+            for stage, (calls, seconds) in self.stages.items()
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "run": self.name,
+            "started": self.started,
+            "stages": self.records(),
+            "counters": self.counters,
+        })
+
+
+_current = contextvars.ContextVar("classroom_perf_run", default=None)
+
+
+def begin_run(name: str) -> Run:
+    """Make a new Run current for this thread (a page calls this once per script run)."""
+
+    run = Run(name)
+    _current.set(run)
+    return run
+
+
+def current_run():
+    return _current.get()
+
+
+def end_run(run: Run):
+    """Finish `run`: append it to CLASSROOM_PERF_LOG if set."""
+
+    if PERF_LOG and run.stages:
+        with _lock, open(PERF_LOG, "a", encoding="utf-8") as fh:
+            fh.write(run.to_json() + "\n")
+
+
+# ---------------- Recording ----------------
+def record(stage: str, seconds: float):
+    with _lock:
+        _stage_seconds.observe(seconds, stage)
+    run = _current.get()
+    if run is not None:
+        run.add_span(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as `stage`."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def timed_iter(stage: str, iterable):
+    """Yield from `iterable`, timing each step of it (not the consumer) as `stage`."""
+
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(stage, time.perf_counter() - start)
+            return
+        record(stage, time.perf_counter() - start)
+        yield item
+
+
+def count(counter: str, value: float = 1):
+    """Add `value` to a counter (e.g. tokens, utterances)."""
+
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + value
+    run = _current.get()
+    if run is not None:
+        run.add_count(counter, value)
+
+
+def observe_batch(size: int, tokens: int):
+    """One forward pass of `size` utterances and `tokens` padded tokens."""
+
+    with _lock:
+        _batch_sizes.observe(size)
+    count("batches")
+    count("utterances", size)
+    count("tokens", tokens)
+
+
+# ---------------- Export ----------------
+def prometheus_lines():
+    """Process-wide stage timings and counters in Prometheus text format."""
+
+    with _lock:
+        lines = _stage_seconds.render(label_name="stage")
+        lines += _batch_sizes.render()
+        for counter, value in sorted(_counters.items()):
+            name = f"classroom_{counter}_total"
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+    return lines
+
+
+def prometheus_text() -> str:
+    return "\n".join(prometheus_lines()) + "\n"
+
+
+# ---------------- Streamlit Panel ----------------
+def show_run(run: Run):
+    """Per-stage timings and counters of `run`, in the current Streamlit container."""
+
+    import pandas as pd
+    import streamlit as st
+
+    if not run.stages:
+        st.caption("Nothing timed in this run.")
+        return
+
+    table = pd.DataFrame(run.records())
+    table["ms"] = (table.pop("seconds") * 1000).round(1)
+    st.dataframe(table, hide_index=True, use_container_width=True)
+
+    if run.counters:
+        st.caption(" · ".join(f"{name}: {value:,.0f}" for name, value in run.counters.items()))
+
+
+def sidebar_panel(run: Run):
+    """Collapsible "Performance" panel with the per-stage timings of `run`."""
+
+    import streamlit as st
+
+    end_run(run)
+
+    with st.sidebar.expander("⏱ Performance"):
+        show_run(run)
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+import inference
+from consolidation import LABEL_COLUMNS
+from interaction_metrics import DEFAULT_ALPHA, DEFAULT_BETA, add_metrics
+
+# Transcript -> classification -> label counts -> PNR / IDIR / CBI / quadrant,
+# entirely in memory. Stages hand columnar DataFrames (categorical label and
+# class columns) to each other; Excel is only written if asked for at the end.
+
+# Rows classified per step (also the progress granularity)
+CLASSIFY_CHUNK = 1024
+
+
+# ---------------- Input ----------------
+def transcripts_from_files(files):
+    """
+    {class name: DataFrame(Role, Utterance)} from uploaded files, one class
+    per sheet, as on the Consolidated page. Sheets without Role and
+    Utterance / Utterances columns are skipped and returned separately.
+    Returns (transcripts, skipped) where skipped is a list of (file, sheet).
+    """
+
+    from streaming_io import read_header, read_table, sheet_names
+
+    transcripts = {}
+    skipped = []
+
+    for file in files:
+        for sheet_name in sheet_names(file):
+            header = read_header(file, sheet_name)
+            utterance_column = next((col for col in ("Utterance", "Utterances") if col in header), None)
+
+            if "Role" not in header or utterance_column is None:
+                skipped.append((getattr(file, "name", str(file)), sheet_name))
+                continue
+
+            frame = read_table(file, columns=["Role", utterance_column], sheet_name=sheet_name)
+            transcripts[f"Class {len(transcripts) + 1}"] = frame.rename(columns={utterance_column: "Utterance"})
+
+    return transcripts, skipped
+
+
+# ---------------- Stages ----------------
+def classify_transcripts(transcripts, batch_size: int = inference.DEFAULT_BATCH_SIZE, progress=None):
+    """
+    One long, classified frame for all classes: Class, Role, Utterance,
+    Predicted_Label, Confidence. All classes go through the model together,
+    so duplicates across classes are classified once.
+    `progress(done_rows, total_rows)` is called after every chunk.
+    """
+
+    class_names = list(transcripts)
+    frames = [frame[["Role", "Utterance"]] for frame in transcripts.values()]
+    lengths = [len(frame) for frame in frames]
+
+    classified = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Role", "Utterance"])
+    classified.insert(0, "Class", pd.Categorical(np.repeat(class_names, lengths), categories=class_names))
+
+    roles = classified["Role"].astype(str).tolist()
+    utterances = classified["Utterance"].astype(str).tolist()
+
+    results = []
+    for start in range(0, len(roles), CLASSIFY_CHUNK):
+        results += inference.predict_batch(
+            roles[start:start + CLASSIFY_CHUNK], utterances[start:start + CLASSIFY_CHUNK], batch_size
+        )
+        if progress is not None:
+            progress(len(results), len(roles))
+
+    classified["Predicted_Label"] = pd.Categorical(
+        [label for label, _ in results], categories=list(LABEL_COLUMNS)
+    )
+    classified["Confidence"] = np.asarray([confidence for _, confidence in results], dtype=np.float32)
+    return classified
+
+
+def aggregate_counts(classified):
+    """Consolidated sheet (Speakers, Lecture ... Response, Total), one row per class."""
+
+    counts = (
+        classified.groupby(["Class", "Predicted_Label"], observed=False)
+        .size()
+        .unstack(fill_value=0)
+        .reindex(columns=list(LABEL_COLUMNS), fill_value=0)
+        .rename(columns=LABEL_COLUMNS)
+    )
+    counts["Total"] = counts.sum(axis=1)
+
+    consolidated = counts.reset_index().rename(columns={"Class": "Speakers"})
+    consolidated.columns.name = None
+    consolidated["Speakers"] = consolidated["Speakers"].astype(str)
+    return consolidated
+
+
+def run_pipeline(transcripts, policy: str = "nan", alpha: float = DEFAULT_ALPHA, beta: float = DEFAULT_BETA,
+                 batch_size: int = inference.DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Every stage in one call. Returns {"classified", "consolidated", "metrics"};
+    "metrics" is the consolidated sheet with pnr, idir, CBI and Quadrant.
+    """
+
+    classified = classify_transcripts(transcripts, batch_size, progress)
+    consolidated = aggregate_counts(classified)
+
+    return {
+        "classified": classified,
+        "consolidated": consolidated,
+        "metrics": add_metrics(consolidated, policy=policy, alpha=alpha, beta=beta),
+    }
+
+
+# ---------------- Output ----------------
+def to_excel(result):
+    """Single optional export of a pipeline result: one sheet per stage."""
+
+    from streaming_io import write_xlsx_sheets
+
+    return write_xlsx_sheets({
+        "Classified": [result["classified"]],
+        "Consolidated": [result["consolidated"]],
+        "Metrics": [result["metrics"]],
+    })
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+
+# Plotly figures for the quadrant and CBI charts that stay responsive for
+# thousands of classes. Above WEBGL_POINTS points the traces are drawn with
+# WebGL (Scattergl). Above MAX_POINTS the data is downsampled on the server
+# first: each quadrant is gridded on its own (so no cell straddles the
+# PNR = 1 / IDIR = 1 lines) and one class per occupied cell is drawn,
+# standing for every class in that cell; extremes and selected classes are
+# always kept. Past LABEL_ALL_POINTS only selected and extreme points get a
+# text label.
+
+WEBGL_POINTS = 1000
+MAX_POINTS = 4000
+LABEL_ALL_POINTS = 50
+
+# Extreme classes labelled per direction (highest / lowest PNR and IDIR)
+EXTREME_LABELS = 5
+
+# Drawn points per series in a downsampled line chart
+MAX_LINE_POINTS = 2000
+
+QUADRANT_COLORS = {"Q1": "red", "Q2": "lightskyblue", "Q3": "blue", "Q4": "pink"}
+
+
+# ---------------- Downsampling ----------------
+def _extremes(x, y, n: int):
+    """Positions of the n highest / lowest x and y values (NaNs ignored)."""
+
+    picked = set()
+    for values in (x, y):
+        defined = np.flatnonzero(~np.isnan(values))
+        order = defined[np.argsort(values[defined], kind="stable")]
+        picked.update(order[:n].tolist())
+        picked.update(order[-n:].tolist())
+    return np.array(sorted(picked), dtype=np.int64)
+
+
+def _grid_representatives(x, y, budget: int):
+    """
+    (positions, counts, cell of every point): one point per occupied cell
+    of a ~sqrt(budget) square grid over the points' own range, and how many
+    points each cell holds.
+    """
+
+    side = max(1, int(np.sqrt(budget)))
+    cells = np.zeros(len(x), dtype=np.int64)
+    for values in (x, y):
+        low, high = values.min(), values.max()
+        span = high - low
+        index = np.zeros(len(values), dtype=np.int64) if span == 0 else np.minimum(
+            ((values - low) / span * side).astype(np.int64), side - 1
+        )
+        cells = cells * side + index
+
+    _, first, cell, counts = np.unique(cells, return_index=True, return_inverse=True, return_counts=True)
+    return first, counts, cell
+
+
+def downsample_quadrants(df, x: str = "idir", y: str = "pnr", quadrant: str = "Quadrant",
+                         max_points: int = MAX_POINTS, keep=None):
+    """
+    At most about `max_points` rows of `df` for a quadrant scatter, with a
+    "Points" column counting the classes each kept row stands for. The
+    budget is split across quadrants by size and each quadrant is gridded
+    separately; its extremes and the rows where `keep` (a boolean mask) is
+    True are always kept. Rows with an undefined ratio can't be drawn and
+    are dropped. Small frames come back unchanged with Points = 1.
+    """
+
+    if len(df) <= max_points:
+        return df.assign(Points=1)
+
+    x_values = df[x].to_numpy(dtype=np.float64)
+    y_values = df[y].to_numpy(dtype=np.float64)
+    keep = np.zeros(len(df), dtype=bool) if keep is None else np.asarray(keep, dtype=bool)
+    defined = ~(np.isnan(x_values) | np.isnan(y_values))
+
+    quadrants = df[quadrant].to_numpy()
+    total = int(defined.sum())
+    positions, points = [], []
+
+    for name in pd.unique(quadrants[defined]):
+        members = np.flatnonzero(defined & (quadrants == name))
+        budget = max(1, int(max_points * len(members) / total))
+        first, counts, cell = _grid_representatives(x_values[members], y_values[members], budget)
+
+        chosen = dict(zip(members[first].tolist(), counts.tolist()))
+        forced = set(_extremes(x_values[members], y_values[members], 1).tolist())
+        forced.update(np.flatnonzero(keep[members]).tolist())
+        for local in forced:
+            position = int(members[local])
+            if position not in chosen:
+                # Drawn on top of its cell's representative, standing for itself only
+                chosen[int(members[first[cell[local]]])] -= 1
+                chosen[position] = 1
+
+        positions += list(chosen)
+        points += list(chosen.values())
+
+    order = np.argsort(positions)
+    return df.iloc[np.asarray(positions)[order]].assign(Points=np.asarray(points)[order])
+
+
+def downsample_lines(df, columns, max_points: int = MAX_LINE_POINTS):
+    """
+    Rows of `df` that keep the shape of every series in `columns` when
+    drawn as lines: rows are cut into buckets and, per bucket, the rows
+    holding each series' minimum and maximum are kept (plus the first and
+    last row). Row order is preserved.
+    """
+
+    if len(df) <= max_points or not len(columns):
+        return df
+
+    buckets = max(1, max_points // (2 * len(columns)))
+    edges = np.linspace(0, len(df), buckets + 1).astype(np.int64)
+    keep = {0, len(df) - 1}
+
+    values = df[list(columns)].to_numpy(dtype=np.float64)
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop <= start:
+            continue
+        block = values[start:stop]
+        defined = ~np.isnan(block).all(axis=0)
+        if not defined.any():
+            continue
+        keep.update((start + np.nanargmin(block[:, defined], axis=0)).tolist())
+        keep.update((start + np.nanargmax(block[:, defined], axis=0)).tolist())
+
+    return df.iloc[sorted(keep)]
+
+
+# ---------------- Figures ----------------
+def quadrant_scatter(df, hover_data, selected=(), colors=None, x: str = "idir", y: str = "pnr",
+                     max_points: int = MAX_POINTS):
+    """
+    IDIR-PNR quadrant scatter with the 1 / 1 cross-hairs. Returns
+    (figure, number of classes drawn). `selected` speakers are always drawn
+    and labelled; see the module comment for the large-data behaviour.
+    """
+
+    import plotly.express as px
+
+    selected_mask = df["Speakers"].isin(list(selected)).to_numpy()
+    data = downsample_quadrants(df, x, y, max_points=max_points, keep=selected_mask)
+
+    if len(df) <= LABEL_ALL_POINTS:
+        labels = data["Speakers"].astype(str)
+    else:
+        labelled = data["Speakers"].isin(list(selected)).to_numpy().copy()
+        labelled[_extremes(data[x].to_numpy(dtype=np.float64), data[y].to_numpy(dtype=np.float64), EXTREME_LABELS)] = True
+        labels = data["Speakers"].astype(str).where(labelled, "")
+
+    hover_data = list(hover_data) + (["Points"] if len(data) < len(df) else [])
+    fig = px.scatter(
+        data.assign(Label=labels.to_numpy()), x=x, y=y,
+        color="Quadrant",
+        text="Label",
+        color_discrete_map=colors or QUADRANT_COLORS,
+        hover_data=hover_data,
+        render_mode="webgl" if len(data) > WEBGL_POINTS else "svg",
+    )
+
+    fig.update_traces(textposition="top center")
+    fig.add_hline(y=1, line_dash="dash", line_width=1)
+    fig.add_vline(x=1, line_dash="dash", line_width=1)
+    fig.update_xaxes(title="IDIR")
+    fig.update_yaxes(title="PNR")
+    return fig, len(data)
+
+
+def line_chart(df, x: str, columns, title: str = None, max_points: int = MAX_LINE_POINTS):
+    """px.line of `columns` against `x`, min/max downsampled and in WebGL when large."""
+
+    import plotly.express as px
+
+    data = downsample_lines(df, columns, max_points)
+    large = len(data) > WEBGL_POINTS
+    return px.line(
+        data, x=x, y=list(columns),
+        # Markers only while individual points are still distinguishable
+        markers=not large,
+        title=title,
+        render_mode="webgl" if large else "svg",
+    )
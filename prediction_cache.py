@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Disk-backed cache of model predictions, so repeated utterances ("Yes ma'am",
+# "Very good", a re-uploaded workbook...) skip the model entirely.
+#
+# Keys are content hashes of (model checksum, role, normalized utterance), so
+# replacing any file in the model directory makes every old entry unreachable.
+# Normalization only applies to the key: the model is still given each
+# utterance as written, and re-spaced copies reuse the first one's prediction.
+# Next to the label and confidence, entries keep the full class distribution
+# (float32 bytes), so runner-up labels and margins come from the cache too.
+
+CACHE_PATH = os.environ.get("CLASSROOM_CACHE_PATH", os.path.join(".cache", "predictions.sqlite"))
+MAX_ENTRIES = int(os.environ.get("CLASSROOM_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite limits the number of "?" parameters in one statement
+_SQL_CHUNK = 500
+
+
+# ---------------- Key Helpers ----------------
+def normalize_utterance(text) -> str:
+    """Collapse runs of whitespace and strip the ends."""
+    return " ".join(str(text).split())
+
+
+_checksums = {}
+_checksums_lock = threading.Lock()
+
+
+def model_checksum(model_dir: str) -> str:
+    """
+    sha256 over the names and contents of every file in `model_dir`.
+    Re-hashed only when a file's size or modification time changes.
+    """
+
+    files = sorted(
+        (entry for entry in os.scandir(model_dir) if entry.is_file()),
+        key=lambda entry: entry.name,
+    )
+    fingerprint = tuple(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in files
+    )
+
+    with _checksums_lock:
+        cached = _checksums.get(model_dir)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        for entry in files:
+            digest.update(entry.name.encode("utf-8"))
+            with open(entry.path, "rb") as fh:
+                for block in iter(lambda: fh.read(1 << 20), b""):
+                    digest.update(block)
+
+        _checksums[model_dir] = (fingerprint, digest.hexdigest())
+        return _checksums[model_dir][1]
+
+
+def cache_key(checksum: str, role, utterance: str) -> str:
+    """Content hash for one prediction. `role` may be None for bare texts."""
+    payload = json.dumps([checksum, role, utterance], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ---------------- Cache ----------------
+class PredictionCache:
+    """
+    SQLite store of key -> (label, confidence) and, where it was stored, the
+    class distribution, with least-recently-used eviction once it holds more
+    than `max_entries` rows.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Generous timeout: worker processes may write to the same file at once
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " key TEXT PRIMARY KEY,"
+            " label TEXT NOT NULL,"
+            " confidence REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " probabilities BLOB)"
+        )
+        # Caches created before distributions were stored
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(predictions)")}
+        if "probabilities" not in columns:
+            self._conn.execute("ALTER TABLE predictions ADD COLUMN probabilities BLOB")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Return {key: (label, confidence)} for the keys that are cached."""
+        return self._get(keys, "label, confidence", lambda label, confidence: (label, confidence))
+
+    def get_distributions(self, keys):
+        """
+        Return {key: float32 class distribution} for the keys cached with one
+        (entries stored as label + confidence only count as misses).
+        """
+        return self._get(
+            keys, "probabilities", lambda blob: np.frombuffer(blob, dtype=np.float32),
+            where=" AND probabilities IS NOT NULL",
+        )
+
+    def _get(self, keys, columns: str, decode, where: str = ""):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+
+        with self._lock:
+            for start in range(0, len(keys), _SQL_CHUNK):
+                chunk = keys[start:start + _SQL_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, {columns} FROM predictions WHERE key IN ({marks}){where}",
+                    chunk,
+                ).fetchall()
+                for key, *values in rows:
+                    found[key] = decode(*values)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE predictions SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, items, distributions=None):
+        """
+        Store {key: (label, confidence)}, with {key: class distribution} from
+        `distributions` where given, and evict the oldest rows if over size.
+        """
+
+        if not items:
+            return
+
+        distributions = distributions or {}
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, label, confidence, last_used, probabilities)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [
+                    (key, str(label), float(confidence), now,
+                     np.asarray(distributions[key], dtype=np.float32).tobytes() if key in distributions else None)
+                    for key, (label, confidence) in items.items()
+                ],
+            )
+
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM predictions WHERE key IN ("
+                    " SELECT key FROM predictions ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self):
+        """Hit / miss counters for this process plus the current number of entries."""
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
+
+    def clear(self):
+        """Drop every cached prediction and reset the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM predictions")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
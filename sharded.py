@@ -0,0 +1,207 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import inference
+import perf
+
+# Multi-process classification for very large workbooks: the (Role, Utterance)
+# rows are cut into shards, each worker process loads the model once and
+# classifies whole shards, and results are merged back in row order.
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+DEFAULT_THREADS_PER_WORKER = min(4, os.cpu_count() or 1)
+
+# Shards per worker; more shards means finer-grained progress
+SHARDS_PER_WORKER = 4
+
+
+# ---------------- Worker Side ----------------
+def _init_worker(model_dir: str, backend: str, threads: int, length_policy=("full", None), cascade=None,
+                 weight_loading: str = "copy"):
+    """Runs once in each worker: pin the thread count and load the model."""
+
+    os.environ["CLASSROOM_NUM_THREADS"] = str(threads)
+
+    import torch
+    torch.set_num_threads(threads)
+
+    inference.MODEL_DIR = model_dir
+    # With "mmap", all workers map the same weights file and share one copy of it
+    inference.WEIGHT_LOADING = weight_loading
+    inference.set_backend(backend)
+    inference.set_length_policy(*length_policy)
+    if cascade is not None:
+        inference.set_cascade(*cascade)
+    inference.load_model(model_dir)
+
+
+def _classify_shard(start: int, roles, utterances, batch_size: int, probabilities: bool = False,
+                    length_policy=(None, None)):
+    # The shard's spans and counters go back to the parent with its result
+    run = perf.begin_run("shard")
+    length_mode, max_length = length_policy
+    if probabilities:
+        # A float32 matrix pickles back far smaller than a list of strings
+        result = inference.predict_proba(roles, utterances, batch_size, length_mode=length_mode, max_length=max_length)
+    else:
+        result = inference.predict_labels(roles, utterances, batch_size, length_mode, max_length)
+    return start, result, run
+
+
+# ---------------- Parent Side ----------------
+class ShardPool:
+    """
+    A pool of classification workers that stays alive across calls, so a
+    file streamed in chunks pays the model load only once per worker.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        threads_per_worker: int = DEFAULT_THREADS_PER_WORKER,
+    ):
+        self.workers = workers
+
+        # "spawn" so workers never inherit a half-initialised torch / Streamlit state
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                inference.MODEL_DIR, inference.BACKEND, threads_per_worker,
+                (inference.LENGTH_MODE, inference.MAX_LENGTH),
+                (inference.CASCADE_STAGES, inference.CASCADE_THRESHOLDS, inference.CASCADE_FINAL),
+                inference.WEIGHT_LOADING,
+            ),
+        )
+
+    def iter_predictions(
+        self,
+        roles,
+        utterances,
+        batch_size: int = inference.DEFAULT_BATCH_SIZE,
+        shard_size: int = None,
+        probabilities: bool = False,
+        length_mode: str = None,
+        max_length: int = None,
+    ):
+        """
+        Yield (start_row, labels) for each shard as soon as it finishes, or
+        with `probabilities` (start_row, (probabilities, id_to_label)).
+        `length_mode` / `max_length` default to the workers' (the parent's
+        at pool start) length policy. The workers' spans and counters are
+        merged into the caller's current perf run, stages as "workers/...".
+        """
+
+        roles = [str(role) for role in roles]
+        utterances = [str(utt) for utt in utterances]
+        total = len(roles)
+        if total == 0:
+            return
+
+        if shard_size is None:
+            shard_size = math.ceil(total / (self.workers * SHARDS_PER_WORKER))
+        shard_size = max(1, shard_size)
+
+        futures = [
+            self._pool.submit(
+                _classify_shard,
+                start,
+                roles[start:start + shard_size],
+                utterances[start:start + shard_size],
+                batch_size,
+                probabilities,
+                (length_mode, max_length),
+            )
+            for start in range(0, total, shard_size)
+        ]
+
+        for future in as_completed(futures):
+            start, result, run = future.result()
+            current = perf.current_run()
+            if current is not None:
+                # Summed over all workers, so kept apart from this process's wall-clock stages
+                current.merge(run, prefix="workers/")
+            yield start, result
+
+    def predict_labels(self, roles, utterances, progress=None, **kwargs):
+        """
+        Process-pool form of inference.predict_labels. Returns labels in row order.
+        `progress(done_rows, total_rows)` is called after every finished shard.
+        """
+
+        total = len(roles)
+        labels = [None] * total
+        done = 0
+
+        for start, shard_labels in self.iter_predictions(roles, utterances, **kwargs):
+            labels[start:start + len(shard_labels)] = shard_labels
+            done += len(shard_labels)
+            if progress is not None:
+                progress(done, total)
+
+        return labels
+
+    def predict_proba(self, roles, utterances, progress=None, **kwargs):
+        """
+        Process-pool form of inference.predict_proba: (float32 probabilities
+        in row order, id_to_label). `progress` as for predict_labels.
+        """
+
+        total = len(roles)
+        probabilities, id_to_label = None, None
+        done = 0
+
+        for start, (shard, shard_labels) in self.iter_predictions(roles, utterances, probabilities=True, **kwargs):
+            if probabilities is None:
+                probabilities = np.empty((total, shard.shape[1]), dtype=np.float32)
+                id_to_label = shard_labels
+            probabilities[start:start + len(shard)] = shard
+            done += len(shard)
+            if progress is not None:
+                progress(done, total)
+
+        if probabilities is None:
+            # No rows: nothing ran, so the classes aren't known here either
+            return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=str)
+        return probabilities, id_to_label
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_sharded_predictions(
+    roles,
+    utterances,
+    workers: int = DEFAULT_WORKERS,
+    threads_per_worker: int = DEFAULT_THREADS_PER_WORKER,
+    **kwargs,
+):
+    """One-off ShardPool.iter_predictions (not in row order)."""
+
+    with ShardPool(workers, threads_per_worker) as pool:
+        yield from pool.iter_predictions(roles, utterances, **kwargs)
+
+
+def predict_labels_sharded(
+    roles,
+    utterances,
+    progress=None,
+    workers: int = DEFAULT_WORKERS,
+    threads_per_worker: int = DEFAULT_THREADS_PER_WORKER,
+    **kwargs,
+):
+    """One-off ShardPool.predict_labels. Returns labels in row order."""
+
+    with ShardPool(workers, threads_per_worker) as pool:
+        return pool.predict_labels(roles, utterances, progress=progress, **kwargs)
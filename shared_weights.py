@@ -0,0 +1,236 @@
+"""
+Build the classifier over a read-only memory map of model.safetensors
+instead of reading the weights into each process's own memory. Every
+process on a host that maps the same file then shares one physical copy of
+the weights (the page cache), so replicas and sharded workers stop
+multiplying RSS. Also reports how much of each process's memory is unique
+and how much is shared, for sizing hosts.
+
+    CLASSROOM_WEIGHTS=mmap streamlit run home.py
+    python shared_weights.py report --workers 4
+    python shared_weights.py report --workers 4 --mode copy
+
+Linux only for the memory report (it reads /proc/self/smaps*).
+"""
+
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+WEIGHT_FILE = "model.safetensors"
+
+# safetensors dtype -> torch dtype name
+DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+# smaps_rollup fields summed into each reported figure
+MEMORY_FIELDS = {
+    "rss": ("Rss",),
+    "pss": ("Pss",),
+    "shared": ("Shared_Clean", "Shared_Dirty"),
+    "private": ("Private_Clean", "Private_Dirty"),
+}
+
+
+# ---------------- Memory-Mapped Loading ----------------
+def mmap_state_dict(path: str):
+    """
+    {name: tensor} over a copy-on-write memory map of a safetensors file.
+    No tensor data is read or copied: pages come in from the page cache
+    as they are touched and stay shared with every other process mapping
+    the file, as long as nothing writes to them.
+    """
+
+    import torch
+
+    with open(path, "rb") as fh:
+        # ACCESS_COPY: a private mapping, so torch gets a writable buffer,
+        # but the pages are shared until (never, at inference) written
+        weights = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_size = struct.unpack("<Q", weights[:8])[0]
+    header = json.loads(weights[8:8 + header_size])
+    data_start = 8 + header_size
+
+    state_dict = {}
+    for name, entry in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = getattr(torch, DTYPES[entry["dtype"]])
+        start, stop = entry["data_offsets"]
+        if stop == start:
+            tensor = torch.empty(entry["shape"], dtype=dtype)
+        else:
+            tensor = torch.frombuffer(weights, dtype=dtype, count=(stop - start) // dtype.itemsize,
+                                      offset=data_start + start)
+        state_dict[name] = tensor.view(entry["shape"])
+
+    return state_dict
+
+
+def _materialize_buffers(model):
+    """Non-persistent buffers aren't in the checkpoint; rebuild the known ones off the meta device."""
+
+    import torch
+
+    for module_name, module in model.named_modules():
+        for name, buffer in list(module.named_buffers(recurse=False)):
+            if not buffer.is_meta:
+                continue
+            if name == "position_ids":
+                value = torch.arange(buffer.shape[-1], dtype=buffer.dtype).expand(buffer.shape)
+            elif name == "token_type_ids":
+                value = torch.zeros(buffer.shape, dtype=buffer.dtype)
+            else:
+                raise RuntimeError(f"Don't know how to rebuild buffer {module_name}.{name} for mmap loading")
+            module.register_buffer(name, value, persistent=False)
+
+
+def load_mmap_model(model_dir: str):
+    """
+    AutoModelForSequenceClassification for `model_dir` whose parameters are
+    views into the memory-mapped model.safetensors: the model is built on
+    the meta device (no weights allocated) and the mapped tensors are
+    assigned in place.
+    """
+
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+
+    path = os.path.join(model_dir, WEIGHT_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; mmap loading needs the checkpoint in safetensors format")
+
+    config = AutoConfig.from_pretrained(model_dir)
+    with torch.device("meta"):
+        model = AutoModelForSequenceClassification.from_config(config)
+
+    model.load_state_dict(mmap_state_dict(path), strict=False, assign=True)
+    model.tie_weights()
+    _materialize_buffers(model)
+
+    missing = [name for name, parameter in model.named_parameters() if parameter.is_meta]
+    if missing:
+        raise RuntimeError(f"{path} has no weights for {', '.join(missing[:5])}")
+
+    model.eval()
+    return model
+
+
+# ---------------- Memory Report ----------------
+def _parse_kb(lines, fields):
+    totals = dict.fromkeys(fields, 0)
+    for line in lines:
+        key, _, value = line.partition(":")
+        if key in totals:
+            totals[key] += int(value.split()[0])
+    return totals
+
+
+def memory_usage(mapped_file: str = None):
+    """
+    This process's memory in MB: rss, pss (its fair share of shared pages),
+    shared and private, and with `mapped_file` the Rss / Pss of that
+    file's mappings. None where /proc/self/smaps_rollup doesn't exist.
+    """
+
+    fields = [field for group in MEMORY_FIELDS.values() for field in group]
+    try:
+        with open("/proc/self/smaps_rollup", encoding="utf-8") as fh:
+            totals = _parse_kb(fh, fields)
+    except FileNotFoundError:
+        return None
+
+    usage = {name: sum(totals[field] for field in group) / 1024 for name, group in MEMORY_FIELDS.items()}
+
+    if mapped_file is not None:
+        mapped_file = os.path.realpath(mapped_file)
+        lines, inside = [], False
+        with open("/proc/self/smaps", encoding="utf-8") as fh:
+            for line in fh:
+                first = line.split(maxsplit=1)[0]
+                if "-" in first and not first.endswith(":"):
+                    # A mapping's header line: address range ... path
+                    inside = line.rstrip().endswith(mapped_file)
+                elif inside:
+                    lines.append(line)
+        mapped = _parse_kb(lines, ["Rss", "Pss"])
+        usage["weights_rss"] = mapped["Rss"] / 1024
+        usage["weights_pss"] = mapped["Pss"] / 1024
+
+    return usage
+
+
+def _measure_worker(model_dir: str, barrier):
+    """Load + run the model, then measure while every worker is alive."""
+
+    # CLASSROOM_MODEL_DIR / CLASSROOM_WEIGHTS come from the parent (see measure)
+    import inference
+
+    inference.USE_CACHE = False
+    inference.set_backend("torch")
+    inference.predict_labels(["Teacher", "Student"], ["Open your books to page ten.", "Yes."])
+
+    # Pss splits shared pages between the processes mapping them, so every
+    # worker measures only once all of them have loaded
+    barrier.wait()
+    usage = memory_usage(os.path.join(model_dir, WEIGHT_FILE))
+    barrier.wait()
+    return usage
+
+
+def measure(workers: int, mode: str, model_dir: str):
+    """memory_usage() of `workers` processes each holding the model loaded in `mode`."""
+
+    # Read by the spawned processes when they import inference
+    os.environ["CLASSROOM_MODEL_DIR"] = model_dir
+    os.environ["CLASSROOM_WEIGHTS"] = mode
+
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        barrier = manager.Barrier(workers)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(_measure_worker, model_dir, barrier) for _ in range(workers)]
+            return [future.result() for future in futures]
+
+
+def main():
+    import inference
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="per-process unique / shared memory of N model processes")
+    report.add_argument("--workers", type=int, default=2)
+    report.add_argument("--mode", choices=inference.WEIGHT_LOADING_MODES, default="mmap")
+    report.add_argument("--model-dir", default=inference.MODEL_DIR)
+
+    args = parser.parse_args()
+
+    usages = measure(args.workers, args.mode, args.model_dir)
+    if any(usage is None for usage in usages):
+        parser.exit(1, "No /proc/self/smaps_rollup here; the memory report needs Linux\n")
+
+    weights_mb = os.path.getsize(os.path.join(args.model_dir, WEIGHT_FILE)) / 2 ** 20
+    print(f"{args.workers} processes, weights loaded with {args.mode!r} ({weights_mb:.0f} MB on disk)")
+    print(f"{'process':>8} {'rss':>9} {'pss':>9} {'private':>9} {'shared':>9} {'weights rss':>12} {'weights pss':>12}")
+    for i, usage in enumerate(usages):
+        print(f"{i:>8} {usage['rss']:>9.0f} {usage['pss']:>9.0f} {usage['private']:>9.0f} "
+              f"{usage['shared']:>9.0f} {usage['weights_rss']:>12.0f} {usage['weights_pss']:>12.0f}")
+
+    total_rss = sum(usage["rss"] for usage in usages)
+    total_pss = sum(usage["pss"] for usage in usages)
+    private = sum(usage["private"] for usage in usages) / len(usages)
+    print(f"Sum of RSS: {total_rss:.0f} MB (counts shared pages once per process)")
+    print(f"Sum of PSS: {total_pss:.0f} MB (what the host actually holds)")
+    print(f"Per extra process: ~{private:.0f} MB private")
+
+
+if __name__ == "__main__":
+    main()
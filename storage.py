@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import pandas as pd
+
+# Columnar store for classified transcripts and per-class aggregates.
+#
+#   <store>/classified/<dataset>/Class=<class>/part-*.parquet   (hive partitions)
+#   <store>/aggregates/<dataset>.parquet
+#
+# Low-cardinality label columns are written dictionary-encoded, and files are
+# memory-mapped on read. Excel stays an explicit export step in the pages.
+
+STORE_DIR = os.environ.get("CLASSROOM_STORE_DIR", os.path.join("data", "store"))
+
+CLASSIFIED = "classified"
+AGGREGATES = "aggregates"
+
+# Written as Arrow dictionary columns (pandas category on read)
+DICTIONARY_COLUMNS = ("Class", "Role", "Predicted_Label", "Runner_Up_Label", "Quadrant")
+
+PARTITION_COLUMN = "Class"
+
+# Free-form description of a classified dataset (e.g. the model version)
+METADATA_FILE = "_dataset.json"
+
+
+# ---------------- Helpers ----------------
+def dataset_name(name: str) -> str:
+    """Safe directory / file name for a dataset (e.g. from an upload's file name)."""
+
+    stem = os.path.splitext(os.path.basename(str(name)))[0]
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", stem).strip("._") or "dataset"
+
+
+def _classified_dir(dataset: str, store_dir: str) -> str:
+    return os.path.join(store_dir, CLASSIFIED, dataset_name(dataset))
+
+
+def _aggregates_path(dataset: str, store_dir: str) -> str:
+    return os.path.join(store_dir, AGGREGATES, dataset_name(dataset) + ".parquet")
+
+
+def _to_table(frame):
+    import pyarrow as pa
+
+    frame = frame.copy()
+    for col in DICTIONARY_COLUMNS:
+        if col in frame.columns and not isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype("string").astype("category")
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def _mmap_filesystem():
+    from pyarrow.fs import LocalFileSystem
+    return LocalFileSystem(use_mmap=True)
+
+
+# ---------------- Classified Utterances ----------------
+class ClassifiedWriter:
+    """
+    Write a classified dataset chunk by chunk; the previous version of the
+    dataset is replaced only when the writer is closed without an error.
+    Chunks with a Class column are partitioned by class.
+
+        with ClassifiedWriter("term_1") as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(self, dataset: str, store_dir: str = STORE_DIR, metadata=None):
+        self.root = _classified_dir(dataset, store_dir)
+        self.staging = self.root + ".tmp"
+        self.rows = 0
+        self._parts = 0
+
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+
+        if metadata is not None:
+            with open(os.path.join(self.staging, METADATA_FILE), "w", encoding="utf-8") as fh:
+                json.dump(metadata, fh)
+
+    def write(self, frame):
+        import pyarrow.parquet as pq
+
+        partition_cols = [PARTITION_COLUMN] if PARTITION_COLUMN in frame.columns else None
+        pq.write_to_dataset(
+            _to_table(frame),
+            self.staging,
+            partition_cols=partition_cols,
+            basename_template=f"part-{self._parts}-{{i}}.parquet",
+            use_dictionary=True,
+        )
+        self._parts += 1
+        self.rows += len(frame)
+
+    def commit(self) -> str:
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.replace(self.staging, self.root)
+        return self.root
+
+    def discard(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def save_classified(frames, dataset: str, store_dir: str = STORE_DIR, metadata=None) -> str:
+    """
+    Persist classified utterances (a DataFrame or an iterable of chunks),
+    replacing any previous version of `dataset`. Returns the dataset directory.
+    """
+
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+
+    with ClassifiedWriter(dataset, store_dir, metadata) as writer:
+        for frame in frames:
+            writer.write(frame)
+    return writer.root
+
+
+def load_classified(dataset: str, classes=None, columns=None, store_dir: str = STORE_DIR):
+    """
+    Memory-mapped read of a classified dataset, optionally only some classes
+    (partition pruning) and some columns.
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    root = _classified_dir(dataset, store_dir)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"No classified dataset {dataset!r} in {store_dir}")
+
+    paths = [
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names if name.endswith(".parquet")
+    ]
+    partitioned = any(f"{PARTITION_COLUMN}=" in path for path in paths)
+
+    # Chunks may disagree on types (e.g. an all-empty column in one of them)
+    schema = pa.unify_schemas([pq.read_schema(path) for path in paths], promote_options="permissive")
+    partitioning = None
+    if partitioned:
+        partition_field = pa.field(PARTITION_COLUMN, pa.string())
+        schema = schema.append(partition_field)
+        partitioning = ds.partitioning(pa.schema([partition_field]), flavor="hive")
+
+    dataset_ = ds.dataset(
+        paths, schema=schema, format="parquet", partitioning=partitioning,
+        partition_base_dir=root, filesystem=_mmap_filesystem(),
+    )
+
+    filter_ = None
+    if classes is not None and partitioned:
+        filter_ = ds.field(PARTITION_COLUMN).isin([str(c) for c in classes])
+
+    if columns is not None:
+        # Asking for a column a dataset lacks (e.g. Class when unpartitioned) is not an error
+        columns = [column for column in columns if column in schema.names]
+
+    table = dataset_.to_table(columns=columns, filter=filter_)
+    frame = table.to_pandas()
+
+    # Partition directories come back in path order; restore class order
+    if partitioned and PARTITION_COLUMN in frame.columns:
+        frame = frame.sort_values(PARTITION_COLUMN, kind="stable", key=_natural_key).reset_index(drop=True)
+        order = list(dict.fromkeys(frame[PARTITION_COLUMN]))
+        frame[PARTITION_COLUMN] = pd.Categorical(frame[PARTITION_COLUMN], categories=order)
+        frame = frame[[PARTITION_COLUMN] + [c for c in frame.columns if c != PARTITION_COLUMN]]
+    return frame
+
+
+def read_metadata(dataset: str, store_dir: str = STORE_DIR):
+    """Metadata saved with a classified dataset ({} if none, None if no such dataset)."""
+
+    root = _classified_dir(dataset, store_dir)
+    if not os.path.isdir(root):
+        return None
+
+    path = os.path.join(root, METADATA_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _natural_key(series):
+    # "Class 10" after "Class 9"
+    return series.astype(str).map(
+        lambda value: tuple(int(part) if part.isdigit() else part for part in re.split(r"(\d+)", value))
+    )
+
+
+# ---------------- Aggregates ----------------
+def save_aggregates(df, dataset: str, store_dir: str = STORE_DIR) -> str:
+    """Persist a per-class consolidated / metrics table. Returns the file path."""
+
+    import pyarrow.parquet as pq
+
+    path = _aggregates_path(dataset, store_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(_to_table(df), path + ".tmp", use_dictionary=True)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_aggregates(dataset: str, store_dir: str = STORE_DIR):
+    """Memory-mapped read of a per-class table."""
+
+    import pyarrow.parquet as pq
+
+    path = _aggregates_path(dataset, store_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No aggregates {dataset!r} in {store_dir}")
+    return pq.read_table(path, memory_map=True).to_pandas()
+
+
+# ---------------- Listing ----------------
+def fingerprint(dataset: str, kind: str = CLASSIFIED, store_dir: str = STORE_DIR) -> str:
+    """Changes whenever the stored dataset is rewritten; usable as a page cache key."""
+
+    if kind == AGGREGATES:
+        paths = [_aggregates_path(dataset, store_dir)]
+    else:
+        root = _classified_dir(dataset, store_dir)
+        paths = [os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names]
+
+    stamps = sorted((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths if os.path.exists(path))
+    return hashlib.sha256(repr((kind, dataset_name(dataset), stamps)).encode("utf-8")).hexdigest()
+
+
+def list_datasets(kind: str = CLASSIFIED, store_dir: str = STORE_DIR):
+    """Names of stored classified datasets or aggregate tables."""
+
+    directory = os.path.join(store_dir, kind)
+    if not os.path.isdir(directory):
+        return []
+
+    if kind == AGGREGATES:
+        return sorted(name[:-len(".parquet")] for name in os.listdir(directory) if name.endswith(".parquet"))
+    return sorted(
+        name for name in os.listdir(directory)
+        if os.path.isdir(os.path.join(directory, name)) and not name.endswith(".tmp")
+    )
@@ -0,0 +1,218 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import perf
+
+# Tokenization stage for the classifier: the Rust fast tokenizer (from
+# model/tokenizer.json) encodes a whole column of texts in one batch call,
+# encodings are kept in a bounded LRU so repeated texts are never encoded
+# twice, and a column is held as one flat int32 array plus offsets. Padded
+# batches are cut straight from that array with numpy. Encodings are kept at
+# full length: callers cut them to the model's maximum (truncated) or split
+# long rows into windows (windows) as their length policy says.
+
+DEFAULT_CACHE_ENTRIES = 100_000
+
+
+def special_token_layout(tokenizer):
+    """(leading, trailing) number of special tokens the tokenizer wraps a text in."""
+
+    plain = tokenizer("a", add_special_tokens=False)["input_ids"]
+    wrapped = tokenizer("a")["input_ids"]
+    for head in range(len(wrapped) - len(plain) + 1):
+        if wrapped[head:head + len(plain)] == plain:
+            return head, len(wrapped) - head - len(plain)
+    return 0, 0
+
+
+def load_tokenizer(model_dir: str):
+    """The fast (Rust) tokenizer for `model_dir`; RuntimeError if there is none."""
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+    if not tokenizer.is_fast:
+        raise RuntimeError(
+            f"No fast tokenizer for {model_dir}; save one with "
+            f"AutoTokenizer.from_pretrained(..., use_fast=True).save_pretrained({model_dir!r}) "
+            f"so that {model_dir}/tokenizer.json exists"
+        )
+    return tokenizer
+
+
+def max_input_tokens(tokenizer, model_dir: str) -> int:
+    """
+    Longest input the model in `model_dir` accepts: the tokenizer's
+    model_max_length, capped by the checkpoint's position embeddings
+    (RoBERTa-style models lose pad_token_id + 1 of those to the offset).
+    """
+
+    from transformers import AutoConfig
+
+    limit = tokenizer.model_max_length
+    config = AutoConfig.from_pretrained(model_dir)
+    positions = getattr(config, "max_position_embeddings", None)
+    if positions:
+        if config.model_type in ("roberta", "xlm-roberta", "camembert"):
+            positions -= (config.pad_token_id or 0) + 1
+        limit = min(limit, positions)
+    return int(limit)
+
+
+class EncodedColumn:
+    """
+    Token ids of n texts: `ids` is every text's ids back to back (int32) and
+    text i is ids[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, ids, offsets):
+        self.ids = ids
+        self.offsets = offsets
+        self.lengths = np.diff(offsets)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        lengths = np.fromiter((len(array) for array in arrays), dtype=np.int64, count=len(arrays))
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int32)
+        return cls(ids.astype(np.int32, copy=False), offsets)
+
+    def row(self, index: int):
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def truncated(self, max_length: int, head: int = 1, tail: int = 1):
+        """
+        (column capped at `max_length` tokens, number of rows cut). A cut row
+        keeps its first tokens and its `tail` closing special tokens.
+        """
+
+        long_rows = np.flatnonzero(self.lengths > max_length)
+        if not len(long_rows):
+            return self, 0
+
+        keep = max_length - tail
+        arrays = [self.row(i) for i in range(len(self))]
+        for i in long_rows:
+            ids = arrays[i]
+            arrays[i] = np.concatenate([ids[:keep], ids[len(ids) - tail:]])
+        return EncodedColumn.from_arrays(arrays), len(long_rows)
+
+    def windows(self, max_length: int, head: int = 1, tail: int = 1, stride: int = None):
+        """
+        (column of windows, owner row of each window). Rows longer than
+        `max_length` become overlapping windows over their text tokens, each
+        re-wrapped in the row's special tokens; `stride` defaults to half a
+        window. Shorter rows are a single window.
+        """
+
+        width = max_length - head - tail
+        stride = stride or max(1, width // 2)
+
+        arrays, owners = [], []
+        for i in range(len(self)):
+            ids = self.row(i)
+            if len(ids) <= max_length:
+                arrays.append(ids)
+                owners.append(i)
+                continue
+
+            prefix, body, suffix = ids[:head], ids[head:len(ids) - tail], ids[len(ids) - tail:]
+            starts = list(range(0, len(body) - width + 1, stride))
+            if starts[-1] + width < len(body):
+                starts.append(len(body) - width)
+            for start in starts:
+                arrays.append(np.concatenate([prefix, body[start:start + width], suffix]))
+                owners.append(i)
+
+        return EncodedColumn.from_arrays(arrays), np.asarray(owners, dtype=np.int64)
+
+    def padded(self, rows, pad_id: int, padding_side: str = "right"):
+        """
+        Model inputs for `rows`: {"input_ids", "attention_mask"} as int64
+        arrays padded to the longest of those rows.
+        """
+
+        rows = np.asarray(rows)
+        lengths = self.lengths[rows]
+        width = int(lengths.max()) if len(rows) else 0
+
+        input_ids = np.full((len(rows), width), pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+
+        for row, (index, length) in enumerate(zip(rows, lengths)):
+            start = self.offsets[index]
+            if padding_side == "left":
+                input_ids[row, width - length:] = self.ids[start:start + length]
+                attention_mask[row, width - length:] = 1
+            else:
+                input_ids[row, :length] = self.ids[start:start + length]
+                attention_mask[row, :length] = 1
+
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+class TokenCache:
+    """Bounded, thread-safe LRU of text -> int32 token ids for one tokenizer."""
+
+    def __init__(self, tokenizer, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.head, self.tail = special_token_layout(tokenizer)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, texts) -> EncodedColumn:
+        """
+        Encode a column of texts, untruncated; only texts not already cached
+        reach the tokenizer.
+        """
+
+        arrays = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for i, text in enumerate(texts):
+                cached = self._entries.get(text)
+                if cached is not None:
+                    self._entries.move_to_end(text)
+                    arrays[i] = cached
+                else:
+                    missing.setdefault(text, []).append(i)
+            # Repeats within one call are encoded once, so they count as hits
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # One batch call into the Rust tokenizer for every new text
+            with perf.span("tokenize"):
+                encoded = self.tokenizer(list(missing), truncation=False, return_attention_mask=False)["input_ids"]
+            perf.count("tokenized_texts", len(missing))
+
+            with self._lock:
+                for (text, rows), ids in zip(missing.items(), encoded):
+                    array = np.asarray(ids, dtype=np.int32)
+                    for i in rows:
+                        arrays[i] = array
+                    self._entries[text] = array
+                    self._entries.move_to_end(text)
+
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return EncodedColumn.from_arrays(arrays)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()